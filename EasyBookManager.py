@@ -4,21 +4,24 @@ icon Color rgb(36, 93, 178)
 
 import json
 import os
+import queue
 import sys
-import time
 import tkinter as tk
 from tkinter import messagebox
 import tkinter.ttk as ttk
 from threading import Thread
-import traceback
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
 
-from chardet import detect
 import customtkinter as ctk
 from PIL import Image
-import pandas as pd
 from book_search_api import calc_both_isbn
 
 from utils import Database
+from log_config import setup_logging_from_settings
+from metrics import timed
+
+logger = getLogger(__name__)
 
 class MainWindow(ctk.CTk):
     def __init__(self):
@@ -33,6 +36,7 @@ class MainWindow(ctk.CTk):
         self.iconbitmap(temp_path('images/favicon.ico'))
 
         self.db = Database()
+        setup_logging_from_settings(self.db.settings)
         
         self.create_frame()
 
@@ -41,8 +45,15 @@ class MainWindow(ctk.CTk):
         
         self.select_frame_by_name('Search')
         self.set_menu_on_off(False)
+        self.protocol('WM_DELETE_WINDOW', self.on_closing)
         self.mainloop()
 
+    def on_closing(self):
+        # 終了時にAPIの統計情報を保存する
+        if self.db.provider_health is not None:
+            self.db.provider_health.save()
+        self.destroy()
+
     def create_frame(self):
         self.menu_frame = ctk.CTkFrame(self, corner_radius=0)
         self.menu_frame.pack(fill=ctk.Y, side=ctk.LEFT)
@@ -114,6 +125,11 @@ class MainWindow(ctk.CTk):
                                                   , command=lambda: self.select_frame_by_name('Export'), image=self.csv_export_button_logo, font=self.menu_font, anchor="w")
         self.csv_export_button.grid(row=4, column=0, sticky='ew')
 
+        # 診断ボタン(処理時間の計測結果を表示する)
+        self.diagnostics_button = ctk.CTkButton(self.menu_frame, corner_radius=0, height=30, border_spacing=10, text=' 診断', fg_color="transparent", text_color=("gray15", "gray85"), hover_color=("gray70", "gray30")
+                                                , command=lambda: DiagnosticsWindow(self), font=self.menu_font, anchor="w")
+        self.diagnostics_button.grid(row=6, column=0, sticky='ew')
+
         pass
 
     def create_search_frame_contents(self):
@@ -180,15 +196,32 @@ class MainWindow(ctk.CTk):
         for column, width in zip(self.book_table_colmuns, self.width_list):
             self.book_table.heading(column, text=column)
             self.book_table.column(column, minwidth=width, width=width)
-        self.update_book_table(self.db.search_book())
         self.book_table.bind("<Double-1>", self.table_click)
+        # 表示中の行の値(ISBN10ごと)
+        self.book_table_rows = {}
+
+        self.book_table_status_label = ctk.CTkLabel(self.search_frame, text="", font=ctk.CTkFont(size=12), anchor="e")
+        self.book_table_status_label.pack(fill=ctk.X, side=ctk.BOTTOM, padx=10)
 
-        ysb = tk.Scrollbar(self.search_frame, orient='vertical', width=16, command=self.book_table.yview)
-        ysb.pack(side='right', fill='y')
-        self.book_table.configure(yscrollcommand=ysb.set)
+        self.book_table_ysb = tk.Scrollbar(self.search_frame, orient='vertical', width=16, command=self.book_table.yview)
+        self.book_table_ysb.pack(side='right', fill='y')
+        self.book_table.configure(yscrollcommand=self.book_table_scrolled)
 
         self.book_table.pack(fill=ctk.BOTH, expand=True)
 
+        # 検索結果はスクロールに合わせてページごとに読み込む
+        self.book_table_page_size = self.db.settings.get('GUI', 'page_size')
+        self.book_table_filters = {}
+        self.book_table_loaded = 0
+        self.book_table_total = 0
+        self.book_table_page_loading = False
+        self.book_table_search_scheduler = SearchScheduler(self, self.query_book_table_page, self.apply_book_table_page, self.db.settings.get('GUI', 'search_debounce_ms'))
+        # 次のページも別スレッドで読み込み、検索条件が変わっていた場合は反映しない
+        self.book_table_page_scheduler = SearchScheduler(self, self.query_next_book_table_page, self.apply_next_book_table_page, 0)
+        # 一覧は画面を表示してから(メインループの開始後に)別スレッドで読み込む
+        self.book_table_status_label.configure(text="読み込み中...")
+        self.after_idle(self.book_table_search_scheduler.schedule_now)
+
 
     def create_add_frame_contents(self):
         self.add_frame_label = ctk.CTkLabel(self.add_frame, text="本の追加", font=ctk.CTkFont(size=20), anchor="w")
@@ -206,12 +239,32 @@ class MainWindow(ctk.CTk):
         self.add_isbn_search_button = ctk.CTkButton(self.add_frame, text="検索", font=ctk.CTkFont(size=14), command=self.search_isbn)
         self.add_isbn_search_button.pack(side=ctk.TOP, padx=10, pady=10)
 
+        # 納品書などのISBNの一覧から本の情報を事前に取得しておく
+        self.prefetch_frame = ctk.CTkFrame(self.add_frame, corner_radius=0, fg_color="transparent")
+        self.prefetch_frame.pack(fill=ctk.X, side=ctk.TOP, pady=10)
+        self.prefetch_label = ctk.CTkLabel(self.prefetch_frame, text="事前取得", font=ctk.CTkFont(size=14), anchor="w")
+        self.prefetch_label.pack(side=ctk.LEFT, padx=10)
+        self.prefetch_file_button = ctk.CTkButton(self.prefetch_frame, text="ファイルから", font=ctk.CTkFont(size=14), command=self.prefetch_from_file)
+        self.prefetch_file_button.pack(side=ctk.LEFT, padx=10)
+        self.prefetch_clipboard_button = ctk.CTkButton(self.prefetch_frame, text="クリップボードから", font=ctk.CTkFont(size=14), command=self.prefetch_from_clipboard)
+        self.prefetch_clipboard_button.pack(side=ctk.LEFT, padx=10)
+        self.prefetch_cancel_button = ctk.CTkButton(self.prefetch_frame, text="中止", font=ctk.CTkFont(size=14), command=self.cancel_prefetch, state='disabled')
+        self.prefetch_cancel_button.pack(side=ctk.LEFT, padx=10)
+        self.prefetch_progress_label = ctk.CTkLabel(self.add_frame, text="", font=ctk.CTkFont(size=14), anchor="w")
+        self.prefetch_progress_label.pack(fill=ctk.X, side=ctk.TOP, padx=10)
+        self.prefetcher = None
+
     def create_import_frame_contents(self):
         self.import_frame_label = ctk.CTkLabel(self.import_frame, text="CSVのインポート", font=ctk.CTkFont(size=20), anchor="w")
         self.import_frame_label.pack(fill=ctk.X, side=ctk.TOP, padx=10)
 
         self.import_frame_button = ctk.CTkButton(self.import_frame, text="ファイルを選択", font=ctk.CTkFont(size=14), command=self.import_csv)
         self.import_frame_button.pack(fill=ctk.X, side=ctk.TOP, padx=10, pady=10)
+
+        self.import_isbn_list_button = ctk.CTkButton(self.import_frame, text="ISBNリストから一括登録", font=ctk.CTkFont(size=14), command=self.import_isbn_list)
+        self.import_isbn_list_button.pack(fill=ctk.X, side=ctk.TOP, padx=10, pady=10)
+        self.import_progress_label = ctk.CTkLabel(self.import_frame, text="", font=ctk.CTkFont(size=14), anchor="w")
+        self.import_progress_label.pack(fill=ctk.X, side=ctk.TOP, padx=10)
         pass
 
     def create_export_frame_contents(self):
@@ -223,12 +276,110 @@ class MainWindow(ctk.CTk):
 
         self.export_frame_button = ctk.CTkButton(self.export_frame, text="Shift-JISでCSV出力", font=ctk.CTkFont(size=14), command=lambda: self.export_csv('shift-jis'))
         self.export_frame_button.pack(fill=ctk.X, side=ctk.TOP, padx=10, pady=10)
+
+        self.export_compress_checkbox = ctk.CTkCheckBox(self.export_frame, text="gzipで圧縮する", font=ctk.CTkFont(size=14))
+        self.export_compress_checkbox.pack(fill=ctk.X, side=ctk.TOP, padx=10, pady=10)
+        self.export_progress_label = ctk.CTkLabel(self.export_frame, text="", font=ctk.CTkFont(size=14), anchor="w")
+        self.export_progress_label.pack(fill=ctk.X, side=ctk.TOP, padx=10)
         pass
 
+    @timed('update_book_table')
     def update_book_table(self, book_info):
-        self.book_table.delete(*self.book_table.get_children())
+        # 表示中の行と比較し、追加・変更・削除・並び替えが必要な行のみ更新する
+        new_ids = [f"{book.isbn_10}" for book in book_info]
+        new_id_set = set(new_ids)
+        removed = [iid for iid in self.book_table.get_children() if iid not in new_id_set]
+        if len(removed) > 0:
+            self.book_table.delete(*removed)
+            for iid in removed:
+                del self.book_table_rows[iid]
+        current = self.book_table.get_children()
+        position = 0
+        moved = set()
+        for index, (iid, book) in enumerate(zip(new_ids, book_info)):
+            while position < len(current) and current[position] in moved:
+                position += 1
+            values = book_table_values(book)
+            if position < len(current) and current[position] == iid:
+                position += 1
+                if self.book_table_rows[iid] != values:
+                    self.book_table.item(iid, values=values)
+            elif iid in self.book_table_rows:
+                self.book_table.move(iid, "", index)
+                moved.add(iid)
+                if self.book_table_rows[iid] != values:
+                    self.book_table.item(iid, values=values)
+            else:
+                self.book_table.insert("", index, id=iid, values=values)
+            self.book_table_rows[iid] = values
+
+    def update_book_table_row(self, isbn_10):
+        # 1冊分の行のみを最新の情報に更新する
+        iid = f"{isbn_10}"
+        book_info = self.db.search_book_rows(isbn=isbn_10)
+        if len(book_info) == 0:
+            self.remove_book_table_row(isbn_10)
+            return
+        if iid in self.book_table_rows:
+            values = book_table_values(book_info[0])
+            if self.book_table_rows[iid] != values:
+                self.book_table.item(iid, values=values)
+                self.book_table_rows[iid] = values
+
+    def remove_book_table_row(self, isbn_10):
+        iid = f"{isbn_10}"
+        if iid in self.book_table_rows:
+            self.book_table.delete(iid)
+            del self.book_table_rows[iid]
+            self.book_table_loaded -= 1
+            self.book_table_total -= 1
+            self.update_book_table_status()
+
+    def query_book_table_page(self, **filters):
+        total = self.db.count_books(**filters)
+        book_info = self.db.search_book_rows(**filters, limit=self.book_table_page_size, offset=0)
+        return filters, total, book_info
+
+    def apply_book_table_page(self, result):
+        filters, total, book_info = result
+        self.book_table_filters = filters
+        self.book_table_total = total
+        self.update_book_table(book_info)
+        self.book_table_loaded = len(book_info)
+        # 読み込み中だった前の検索条件の次のページは反映しない
+        self.book_table_page_loading = False
+        self.update_book_table_status()
+
+    def query_next_book_table_page(self, filters, offset):
+        book_info = self.db.search_book_rows(**filters, limit=self.book_table_page_size, offset=offset)
+        return filters, offset, book_info
+
+    def apply_next_book_table_page(self, result):
+        filters, offset, book_info = result
+        self.book_table_page_loading = False
+        if filters != self.book_table_filters or offset != self.book_table_loaded:
+            return
         for book in book_info:
-            self.book_table.insert("", "end", id=f"{book['isbn_10']}", values=[book['title'], book['author'], book['publisher'], book['subject'], book['place'], book['remarks'], book['number']])
+            iid = f"{book.isbn_10}"
+            if iid not in self.book_table_rows:
+                values = book_table_values(book)
+                self.book_table.insert("", "end", id=iid, values=values)
+                self.book_table_rows[iid] = values
+        self.book_table_loaded += len(book_info)
+        if len(book_info) == 0:
+            # 読み込み中に本が削除された場合は件数を合わせる
+            self.book_table_total = self.book_table_loaded
+        self.update_book_table_status()
+
+    def book_table_scrolled(self, first, last):
+        self.book_table_ysb.set(first, last)
+        # 末尾付近までスクロールされたら次のページを読み込む
+        if float(last) > 0.9 and self.book_table_loaded < self.book_table_total and not self.book_table_page_loading:
+            self.book_table_page_loading = True
+            self.book_table_page_scheduler.schedule_now(filters=self.book_table_filters, offset=self.book_table_loaded)
+
+    def update_book_table_status(self):
+        self.book_table_status_label.configure(text=f"{self.book_table_total}件中 {self.book_table_loaded}件を表示")
 
     def menu_on_off(self):
         if self.menu_frame.winfo_ismapped():# メニューが表示されている場合
@@ -274,9 +425,16 @@ class MainWindow(ctk.CTk):
         isbn = self.add_isbn_entry.get()
         try:
             isbn10, isbn13 = calc_both_isbn(isbn)
-            print(isbn10, isbn13)
-            if self.db.search_book(isbn=isbn13):
+            logger.debug("Add book ISBN: isbn_10=%s, isbn_13=%s", isbn10, isbn13)
+            if self.db.check_book_exist(isbn13):
                 messagebox.showerror('ISBNエラー', 'すでに登録されているISBNです')
+                return
+            # 事前取得で見つかっていた場合は検索を待たずに表示する
+            # (見つからなかった結果はAPIの障害によることもあるため、改めて検索する)
+            prefetched, book_info = self.db.get_prefetched_book_info(isbn13)
+            if prefetched and book_info is not None:
+                self.add_isbn_entry.delete(0, 'end')
+                AddBook(self, isbn10, isbn13, book_info)
             else:
                 self.add_isbn_search_button.configure(state='disabled')
                 Thread(target=self.add_book, args=(isbn10, isbn13)).start()
@@ -286,28 +444,82 @@ class MainWindow(ctk.CTk):
 
     def add_book(self, isbn10, isbn13):
         wait = WaitBookSearch(self)
-        book_info = self.db.isbn_search_book(isbn13)
+        # 登録済みかどうかはsearch_isbnで確認済み
+        book_info = self.db.isbn_search_book(isbn13, check_exists=False)
         wait.destroy()
         AddBook(self, isbn10, isbn13, book_info)
         self.add_isbn_search_button.configure(state='normal')
 
+    def prefetch_from_file(self):
+        file_path = ctk.filedialog.askopenfilename(filetypes=[('ISBNの一覧', '*.txt *.csv'), ('すべてのファイル', '*.*')])
+        if file_path:
+            from batch_import import iter_isbns
+            self.start_prefetch(iter_isbns(file_path))
+
+    def prefetch_from_clipboard(self):
+        from prefetch import parse_isbn_text
+        try:
+            isbns = parse_isbn_text(self.clipboard_get())
+        except tk.TclError:
+            isbns = []
+        if len(isbns) == 0:
+            messagebox.showerror('事前取得エラー', 'クリップボードにISBNがありません')
+            return
+        self.start_prefetch(isbns)
+
+    def start_prefetch(self, isbns):
+        from prefetch import IsbnPrefetcher
+        self.prefetch_file_button.configure(state='disabled')
+        self.prefetch_clipboard_button.configure(state='disabled')
+        self.prefetch_cancel_button.configure(state='normal')
+        self.prefetcher = IsbnPrefetcher(self.db)
+        Thread(target=self.run_prefetch, args=(self.prefetcher, isbns), daemon=True).start()
+
+    def run_prefetch(self, prefetcher, isbns):
+        try:
+            result = prefetcher.run(isbns, progress_callback=lambda progress: self.after(0, self.show_prefetch_progress, progress))
+        except:
+            logger.exception("Prefetch failed")
+            result = None
+        self.after(0, self.finish_prefetch, result)
+
+    def show_prefetch_progress(self, progress):
+        self.prefetch_progress_label.configure(text=f"事前取得: {progress['processed']}件 (見つかった: {progress['found']}件、見つからなかった: {progress['not_found']}件、取得済み: {progress['prefetched']}件、登録済み: {progress['exists']}件)")
+
+    def cancel_prefetch(self):
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+            self.prefetch_cancel_button.configure(state='disabled')
+
+    def finish_prefetch(self, result):
+        self.prefetcher = None
+        self.prefetch_file_button.configure(state='normal')
+        self.prefetch_clipboard_button.configure(state='normal')
+        self.prefetch_cancel_button.configure(state='disabled')
+        if result is None:
+            messagebox.showerror('事前取得エラー', 'ISBNの事前取得に失敗しました')
+            return
+        self.show_prefetch_progress(result)
+
     def search_book_entry_check(self, *args):
         isbn = self.book_search_isbn_entry.get()
-        isbn = ''.join(char for char in isbn if char.isdigit())
-        self.book_search_isbn_string.set(isbn)
+        isbn_digits = ''.join(char for char in isbn if char.isdigit())
+        if isbn_digits != isbn:
+            # 数字以外を取り除いた値を設定すると再度この関数が呼ばれるため、変更がある場合のみ設定する
+            self.book_search_isbn_string.set(isbn_digits)
+            return
         title = self.book_search_title_entry.get()
         author = self.book_search_author_entry.get()
         publisher = self.book_search_publisher_entry.get()
         subject = self.book_search_subject_entry.get()
         place = self.book_search_place_entry.get()
-        print(isbn, title, author, publisher, subject, place)
+        logger.debug("Search entry changed: isbn=%s, title=%s, author=%s, publisher=%s, subject=%s, place=%s", isbn, title, author, publisher, subject, place)
         try:
             isbn10, isbn13 = calc_both_isbn(isbn)
             isbn = isbn13
         except:
             isbn = ''
-        book_info = self.db.search_book(isbn=isbn, title=title, author=author, publisher=publisher, subject=subject, place=place)
-        self.update_book_table(book_info)
+        self.book_table_search_scheduler.schedule(isbn=isbn, title=title, author=author, publisher=publisher, subject=subject, place=place)
 
     def check_isbn(self, *args):
         isbn = self.add_isbn_entry.get()
@@ -324,61 +536,82 @@ class MainWindow(ctk.CTk):
         place = item[4]
         remark = item[5]
         number = item[6]
-        print(title, author, publisher, subject, place)
+        logger.debug("Table clicked: isbn_10=%s, title=%s", isbn, title)
         ChangeBook(self, isbn, title, author, publisher, subject, place, remark, number)
 
     def import_csv(self):
         file_path = ctk.filedialog.askopenfilename(filetypes=[('CSVファイル', '*.csv')])
         if file_path:
-            try:
-                with open(file_path, 'rb') as f:
-                    encoding = detect(f.read())['encoding']
-                ok_encoding_list = ['utf-8', 'shift_jis']
-                if encoding.lower() in ok_encoding_list:
-                    book_pd = pd.read_csv(file_path, encoding=encoding)
-                    book_pd = book_pd.fillna('') 
-                    book_list = []
-                    for index, row in book_pd.iterrows():
-                        isbn10, isbn13 = calc_both_isbn(row['isbn'])
-                        if not self.db.check_book_exist(isbn13):
-                            book_info = {
-                                'isbn_10': isbn10,
-                                'isbn_13': isbn13,
-                                'title': row['タイトル'],
-                                'author': row['著者'],
-                                'publisher': row['出版社'],
-                                'subject': row['件名標目'],
-                                'place': row['保管場所'],
-                                'remarks': row.get('備考', ''),
-                            }
-                            try:
-                                book_info['number'] = str(int(row['所持数']))
-                            except:
-                                book_info['number'] = ''
-
-                            book_list.append(book_info)
-
-                    for book_info in book_list:
-                        self.db.register_book(book_info)
-                    self.search_book_entry_check()
-                    messagebox.showinfo('インポート完了', 'CSVのインポートが完了しました')
-                else:
-                    messagebox.showerror('インポートエラー', 'CSVのインポートに失敗しました')
-            except:
-                print(traceback.format_exc())
-                messagebox.showerror('インポートエラー', 'CSVのインポートに失敗しました')
-    
+            self.import_frame_button.configure(state='disabled')
+            Thread(target=self.run_csv_import, args=(file_path,), daemon=True).start()
+
+    def run_csv_import(self, file_path):
+        try:
+            # pandasの読み込みに時間がかかるため、使うときに読み込む
+            import csv_io
+            result = csv_io.import_csv(self.db, file_path, progress_callback=lambda rows: self.after(0, lambda: self.import_progress_label.configure(text=f"読み込み済み: {rows}行")))
+            self.after(0, self.finish_csv_import, result)
+        except:
+            logger.exception("CSV import failed: file_path=%s", file_path)
+            self.after(0, self.finish_csv_import, None)
+
+    def finish_csv_import(self, result):
+        self.import_frame_button.configure(state='normal')
+        if result is None:
+            messagebox.showerror('インポートエラー', 'CSVのインポートに失敗しました')
+            return
+        self.import_progress_label.configure(text=f"読み込み済み: {result['rows']}行")
+        self.search_book_entry_check()
+        messagebox.showinfo('インポート完了', f"CSVのインポートが完了しました\n登録: {result['registered']}件  スキップ: {result['skipped']}件  不正なISBN: {result['invalid']}件")
+
+    def import_isbn_list(self):
+        file_path = ctk.filedialog.askopenfilename(filetypes=[('ISBNリスト', '*.csv *.txt')])
+        if file_path:
+            self.import_isbn_list_button.configure(state='disabled')
+            Thread(target=self.run_isbn_list_import, args=(file_path,), daemon=True).start()
+
+    def run_isbn_list_import(self, file_path):
+        try:
+            from batch_import import BatchIsbnImporter
+            result = BatchIsbnImporter(self.db).run(file_path, progress_callback=lambda progress: self.after(0, self.show_import_progress, progress))
+            self.after(0, self.finish_isbn_list_import, result)
+        except:
+            logger.exception("ISBN list import failed: file_path=%s", file_path)
+            self.after(0, self.finish_isbn_list_import, None)
+
+    def show_import_progress(self, progress):
+        self.import_progress_label.configure(text=f"処理済み: {progress['processed']}件  登録: {progress['registered']}件  ({progress['isbn_per_second']:.1f}件/秒)")
+
+    def finish_isbn_list_import(self, result):
+        self.import_isbn_list_button.configure(state='normal')
+        if result is None:
+            messagebox.showerror('インポートエラー', 'ISBNリストのインポートに失敗しました')
+            return
+        self.show_import_progress(result)
+        self.search_book_entry_check()
+        messagebox.showinfo('インポート完了', f"ISBNリストのインポートが完了しました\n登録: {result['registered']}件  情報なし(未登録): {result['unresolved']}件\n登録済み: {result['exists']}件  重複: {result['duplicated']}件  不正なISBN: {result['invalid']}件")
+
     def export_csv(self, encoding):
-        file_path = ctk.filedialog.asksaveasfilename(filetypes=[('CSVファイル', '*.csv')])
+        compress = self.export_compress_checkbox.get() == 1
+        if compress:
+            file_path = ctk.filedialog.asksaveasfilename(filetypes=[('gzip圧縮CSVファイル', '*.csv.gz')])
+        else:
+            file_path = ctk.filedialog.asksaveasfilename(filetypes=[('CSVファイル', '*.csv')])
         if file_path:
-            try:
-                if not file_path.endswith('.csv'):
-                    file_path += '.csv'
-                book_pd = pd.DataFrame(self.db.create_download_data())
-                book_pd.to_csv(file_path, index=False, encoding=encoding)
-                messagebox.showinfo('エクスポート完了', 'CSVのエクスポートが完了しました')
-            except:
-                messagebox.showerror('エクスポートエラー', 'CSVのエクスポートに失敗しました')
+            if compress and not file_path.endswith('.csv.gz'):
+                file_path += '.gz' if file_path.endswith('.csv') else '.csv.gz'
+            elif not compress and not file_path.endswith('.csv'):
+                file_path += '.csv'
+            Thread(target=self.run_csv_export, args=(file_path, encoding, compress), daemon=True).start()
+
+    def run_csv_export(self, file_path, encoding, compress):
+        try:
+            import csv_io
+            csv_io.export_csv(self.db, file_path, encoding, compress=compress, progress_callback=lambda written, total: self.after(0, lambda: self.export_progress_label.configure(text=f"書き出し済み: {written}/{total}件")))
+            self.after(0, lambda: messagebox.showinfo('エクスポート完了', 'CSVのエクスポートが完了しました'))
+        except:
+            logger.exception("CSV export failed: file_path=%s", file_path)
+            self.after(0, lambda: messagebox.showerror('エクスポートエラー', 'CSVのエクスポートに失敗しました'))
 
 class ChangeBook(ctk.CTkToplevel):
     def __init__(self, master, isbn, title, author, publisher, subject, place, remark, number):
@@ -485,13 +718,13 @@ class ChangeBook(ctk.CTkToplevel):
 
     def change_book(self):
         self.master.db.update_book(self.isbn_10, self.isbn_13, self.title_entry.get(), self.author_entry.get(), self.publisher_entry.get(), self.subject_entry.get(), self.number_entry.get(), self.remark_entry.get(), self.place_entry.get())
-        self.master.update_book_table(self.master.db.search_book())
+        self.master.update_book_table_row(self.isbn_10)
         self.destroy()
 
     def delete_book(self):
         if messagebox.askyesno('本の削除', '本を削除しますか？'):
             self.master.db.delete_book(self.isbn_10)
-            self.master.update_book_table(self.master.db.search_book())
+            self.master.remove_book_table_row(self.isbn_10)
             self.destroy()
 
     def number_check(self, *args):
@@ -641,6 +874,152 @@ class WaitBookSearch(ctk.CTkToplevel):
 
 
 
+class DiagnosticsWindow(ctk.CTkToplevel):
+    def __init__(self, master):
+        super().__init__(master)
+        self.master = master
+        self.title('診断')
+        self.iconbitmap(temp_path('images/favicon.ico'))
+        self.after(201, lambda: self.iconbitmap(temp_path('images/favicon.ico')))
+        self.geometry('720x480')
+        self.create_widgets()
+        self.refresh()
+
+    def create_widgets(self):
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.button_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.button_frame.grid(row=0, column=0, sticky='ew', padx=10, pady=(10, 0))
+        self.enabled_checkbox = ctk.CTkCheckBox(self.button_frame, text='計測を有効にする', command=self.toggle_enabled)
+        if self.master.db.metrics.enabled:
+            self.enabled_checkbox.select()
+        self.enabled_checkbox.pack(side=ctk.LEFT)
+        self.refresh_button = ctk.CTkButton(self.button_frame, text='更新', width=80, command=self.refresh)
+        self.refresh_button.pack(side=ctk.LEFT, padx=5)
+        self.reset_button = ctk.CTkButton(self.button_frame, text='リセット', width=80, command=self.reset)
+        self.reset_button.pack(side=ctk.LEFT, padx=5)
+        self.dump_json_button = ctk.CTkButton(self.button_frame, text='JSONで保存', width=100, command=lambda: self.dump('.json'))
+        self.dump_json_button.pack(side=ctk.LEFT, padx=5)
+        self.dump_prometheus_button = ctk.CTkButton(self.button_frame, text='Prometheus形式で保存', width=160, command=lambda: self.dump('.prom'))
+        self.dump_prometheus_button.pack(side=ctk.LEFT, padx=5)
+
+        self.textbox = ctk.CTkTextbox(self, font=ctk.CTkFont(family='Consolas', size=12))
+        self.textbox.grid(row=1, column=0, sticky='nsew', padx=10, pady=10)
+
+    def toggle_enabled(self):
+        enabled = self.enabled_checkbox.get() == 1
+        self.master.db.metrics.enabled = enabled
+        self.master.db.settings.set('Metrics', 'enabled', enabled)
+        self.refresh()
+
+    def reset(self):
+        self.master.db.metrics.reset()
+        self.refresh()
+
+    def refresh(self):
+        snapshot = self.master.db.get_metrics()
+        lines = [f"{'項目':<32}{'回数':>8}{'平均(ms)':>12}{'p50(ms)':>12}{'p99(ms)':>12}{'最大(ms)':>12}"]
+        for histogram in snapshot['histograms']:
+            name = histogram['name'] + ''.join(f"[{value}]" for value in histogram['labels'].values())
+            lines.append(f"{name:<32}{histogram['count']:>8}{histogram['mean'] * 1000:>12.1f}{histogram['p50'] * 1000:>12.1f}{histogram['p99'] * 1000:>12.1f}{histogram['max'] * 1000:>12.1f}")
+        lines.append('')
+        for counter in snapshot['counters']:
+            name = counter['name'] + ''.join(f"[{value}]" for value in counter['labels'].values())
+            lines.append(f"{name:<32}{counter['value']:>8}")
+        lines.append('')
+        lines.append('検索結果のキャッシュ: ' + json.dumps(snapshot['search_cache'], ensure_ascii=False))
+        lines.append('APIの状態: ' + json.dumps(snapshot['provider_health'], ensure_ascii=False, indent=2))
+        self.textbox.configure(state='normal')
+        self.textbox.delete('1.0', 'end')
+        self.textbox.insert('1.0', '\n'.join(lines))
+        self.textbox.configure(state='disabled')
+
+    def dump(self, extension):
+        if extension == '.prom':
+            file_path = ctk.filedialog.asksaveasfilename(filetypes=[('Prometheusテキスト', '*.prom')], defaultextension='.prom')
+        else:
+            file_path = ctk.filedialog.asksaveasfilename(filetypes=[('JSONファイル', '*.json')], defaultextension='.json')
+        if file_path:
+            self.master.db.dump_metrics(file_path)
+            messagebox.showinfo('保存完了', f'計測結果を保存しました\n{file_path}', parent=self)
+
+class SearchScheduler:
+    def __init__(self, master, search_function, apply_function, delay_ms):
+        """入力が落ち着くまで待ってから別スレッドで検索し、最新の結果のみを画面に反映する
+
+        Tkは別スレッドから呼び出せない(メインループの開始前は例外になる)ため、検索結果はキューで受け渡し、
+        メインスレッドがafterで定期的に取り出して反映する。
+
+        Args:
+            master: afterを呼び出すウィジェット
+            search_function (callable): 別スレッドで実行する検索処理
+            apply_function (callable): 検索結果を画面に反映する処理(メインスレッドで実行)
+            delay_ms (int): 最後の入力から検索を開始するまでの待ち時間(ミリ秒)
+        """
+        self.master = master
+        self.search_function = search_function
+        self.apply_function = apply_function
+        self.delay_ms = delay_ms
+        self.after_id = None
+        self.generation = 0
+        # 検索結果の受け渡し用のキューと、結果を待っている検索の数(メインスレッドのみで使う)
+        self.results = queue.Queue()
+        self.pending = 0
+        self.poll_ms = 50
+        self.poll_id = None
+        # 検索は1つずつ実行し、待っている間に古くなった検索は実行しない
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search")
+
+    def schedule(self, **kwargs):
+        if self.after_id is not None:
+            self.master.after_cancel(self.after_id)
+        self.generation += 1
+        self.after_id = self.master.after(self.delay_ms, self.start, self.generation, kwargs)
+
+    def schedule_now(self, **kwargs):
+        # 入力を待たずにすぐ検索する(起動時の一覧の読み込みなど)
+        if self.after_id is not None:
+            self.master.after_cancel(self.after_id)
+        self.generation += 1
+        self.start(self.generation, kwargs)
+
+    def start(self, generation, kwargs):
+        self.after_id = None
+        self.pending += 1
+        self.executor.submit(self.run, generation, kwargs)
+        if self.poll_id is None:
+            self.poll_id = self.master.after(self.poll_ms, self.poll)
+
+    def run(self, generation, kwargs):
+        # 別スレッドで実行されるため、Tkには触らずキューに結果を入れるだけにする
+        succeeded = False
+        result = None
+        try:
+            if generation == self.generation:
+                result = self.search_function(**kwargs)
+                succeeded = True
+        except:
+            logger.exception("Book table search failed: %s", kwargs)
+        finally:
+            self.results.put((generation, succeeded, result))
+
+    def poll(self):
+        self.poll_id = None
+        while True:
+            try:
+                generation, succeeded, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            if succeeded and generation == self.generation:
+                self.apply_function(result)
+        if self.pending > 0:
+            self.poll_id = self.master.after(self.poll_ms, self.poll)
+
+def book_table_values(book):
+    return (book.title, book.author, book.publisher, book.subject, book.place, book.remarks, book.number)
+
 def temp_path(relative_path):
     try:
         #Retrieve Temp Path
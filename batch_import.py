@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from logging import getLogger
+import time
+
+from book_search_api import calc_both_isbn
+
+from utils import Database
+
+# ISBNファイルからISBNを1件ずつ読み込む
+def iter_isbns(file_path):
+    """ISBNファイルからISBNを1件ずつ読み込む
+
+    1行に1件、またはCSVの1列目にISBNが書かれたファイルを想定し、ファイル全体は読み込まない。
+
+    Args:
+        file_path (str): ファイルのパス(標準入力などの開いているファイルも指定できる)
+
+    Yields:
+        str: ISBN(数字とX以外の文字を除いたもの)
+    """
+    if not isinstance(file_path, str):
+        yield from iter_isbn_lines(file_path)
+        return
+    with open(file_path, 'r', encoding='utf-8-sig', errors='ignore') as f:
+        yield from iter_isbn_lines(f)
+
+# 行ごとにISBNを取り出す
+def iter_isbn_lines(lines):
+    for line in lines:
+        isbn = line.split(',', 1)[0]
+        isbn = ''.join(char for char in isbn if char.isdigit() or char in 'xX')
+        if len(isbn) > 0:
+            yield isbn
+
+class BatchIsbnImporter:
+    def __init__(self, db: Database, max_workers: int=None, batch_size: int=None, register_unresolved: bool=False):
+        """ISBNのみのファイルから本の情報を検索して一括登録する
+
+        Args:
+            db (Database): データベース
+            max_workers (int): 同時に検索するISBNの数(省略時は設定ファイルの値)
+            batch_size (int): 1回にまとめて登録する本の数(省略時は設定ファイルの値)
+            register_unresolved (bool): 情報が見つからなかった本もISBNのみで登録するかどうか(APIの障害時も見つからなかった扱いになるため、既定では登録しない)
+        """
+        self.logger = getLogger(__name__)
+        self.db = db
+        self.max_workers = max_workers or db.settings.get('BatchImport', 'max_workers')
+        self.batch_size = batch_size or db.settings.get('BatchImport', 'batch_size')
+        self.register_unresolved = register_unresolved
+
+    # ISBNファイルを一括登録する
+    def run(self, file_path, progress_callback=None) -> dict:
+        """ISBNファイルを一括登録する
+
+        Args:
+            file_path (str): ファイルのパス(標準入力などの開いているファイルも指定できる)
+            progress_callback (callable): 進捗(dict)を受け取る関数
+
+        Returns:
+            dict: 処理結果の件数と処理速度
+        """
+        self.logger.info("Batch import start: file_path=%s", file_path)
+        self.start_time = time.perf_counter()
+        self.stats = {
+            "processed": 0,     # 処理済み
+            "registered": 0,    # 登録済み
+            "resolved": 0,      # 情報が見つかった
+            "unresolved": 0,    # 情報が見つからなかった
+            "exists": 0,        # 既に登録されていた
+            "duplicated": 0,    # ファイル内で重複していた
+            "invalid": 0,       # ISBNが正しくない
+            "failed": 0,        # 登録に失敗した
+        }
+        self.progress_callback = progress_callback
+        book_list = []
+        seen = set()
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch_import") as executor:
+            for isbn in iter_isbns(file_path):
+                try:
+                    isbn_10, isbn_13 = calc_both_isbn(isbn)
+                except ValueError:
+                    self.stats["invalid"] += 1
+                    self.stats["processed"] += 1
+                    continue
+                if isbn_13 in seen:
+                    self.stats["duplicated"] += 1
+                    self.stats["processed"] += 1
+                    continue
+                seen.add(isbn_13)
+                pending.add(executor.submit(self.resolve, isbn_10, isbn_13))
+                # ファイルを先読みしすぎないように処理中の件数を制限する
+                if len(pending) >= self.max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self.collect(done, book_list)
+                    if len(book_list) >= self.batch_size:
+                        self.flush(book_list)
+            self.collect(pending, book_list)
+        self.flush(book_list)
+        result = self.progress()
+        self.logger.info("Batch import finished: %s", result)
+        return result
+
+    # 1件のISBNの情報を検索する
+    def resolve(self, isbn_10: str, isbn_13: str) -> tuple[str, dict]:
+        """1件のISBNの情報を検索する
+
+        Args:
+            isbn_10 (str): ISBN10
+            isbn_13 (str): ISBN13
+
+        Returns:
+            tuple[str, dict]: 検索結果の種類("exists", "resolved", "unresolved")と本の情報
+        """
+        if self.db.check_book_exist(isbn_13):
+            return "exists", None
+        # APIへの問い合わせ中はデータベースの接続を持たない
+        book_info = self.db.isbn_search_book(isbn_13, check_exists=False)
+        if book_info is None:
+            return "unresolved", self.db.merge_book_info(isbn_10, isbn_13, [])
+        return "resolved", book_info
+
+    # 検索が終わった結果を登録待ちに追加する
+    def collect(self, futures, book_list: list[dict]) -> None:
+        for future in futures:
+            try:
+                status, book_info = future.result()
+            except Exception:
+                self.logger.exception("Failed to resolve ISBN")
+                status, book_info = "failed", None
+            self.stats[status] += 1
+            self.stats["processed"] += 1
+            if status == "resolved" or (status == "unresolved" and self.register_unresolved):
+                book_list.append(book_info)
+        if self.progress_callback is not None:
+            self.progress_callback(self.progress())
+
+    # 登録待ちの本をまとめて登録する
+    def flush(self, book_list: list[dict]) -> None:
+        result = self.db.register_books(book_list, batch_size=self.batch_size)
+        self.stats["registered"] += result["registered"]
+        self.stats["failed"] += len(result["conflicts"])
+        book_list.clear()
+        if self.progress_callback is not None:
+            self.progress_callback(self.progress())
+
+    # 進捗を取得する
+    def progress(self) -> dict:
+        elapsed = time.perf_counter() - self.start_time
+        progress = dict(self.stats)
+        progress["elapsed"] = elapsed
+        progress["isbn_per_second"] = self.stats["processed"] / elapsed if elapsed > 0 else 0.0
+        return progress
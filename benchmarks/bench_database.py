@@ -0,0 +1,165 @@
+"""
+Databaseの登録・一括登録・検索・更新・削除・ダウンロード用データ作成のベンチマーク
+
+使い方:
+    python benchmarks/bench_database.py --sizes 1000,10000 --profiles default,balanced,fast --output result.json
+
+Tkを使わずに実行でき、結果(1秒あたりの処理件数とp50/p99の処理時間)をストレージのプロファイルごとにJSONで出力する。
+一括登録を別スレッドで実行しながら検索する場合の検索時間と、ロック待ちで失敗した回数も計測する。
+"""
+
+import argparse
+from itertools import combinations
+import platform
+import random
+import threading
+import time
+
+from common import make_catalogue, measure, summarize, temporary_workdir, write_report
+
+from settings import Settings
+from sqlite_profile import read_pragmas
+from utils import Database, DEFAULT_CONFIG
+
+SEARCH_FIELDS = ('title', 'author', 'publisher', 'subject', 'place')
+
+# 検索語を作成する
+def make_search_term(book: dict, field: str, rng: random.Random, length: int) -> str:
+    value = book[field]
+    if len(value) <= length:
+        return value
+    start = rng.randint(0, len(value) - length)
+    return value[start:start + length]
+
+# 一括登録中の検索時間を計測する
+def run_concurrent_search(db: Database, size: int, queries: int, seed: int, sample: list[dict]) -> dict:
+    rng = random.Random(seed)
+    writer_errors = []
+
+    def write():
+        try:
+            db.register_books(make_catalogue(size, seed=seed + 2, start=size * 2))
+        except Exception as e:
+            writer_errors.append(repr(e))
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    latencies = []
+    errors = 0
+    while writer.is_alive() or len(latencies) < queries:
+        try:
+            elapsed, _ = measure(db.search_book, title=make_search_term(rng.choice(sample), 'title', rng, 3))
+            latencies.append(elapsed)
+        except Exception:
+            errors += 1
+        if not writer.is_alive() and len(latencies) >= queries:
+            break
+    writer.join()
+    return {'search_book': summarize(latencies), 'search_errors': errors, 'writer_errors': writer_errors}
+
+# 1つの蔵書の規模とプロファイルでベンチマークを行う
+def run_size(size: int, queries: int, seed: int, profile: str='balanced') -> dict:
+    rng = random.Random(seed)
+    result = {'size': size, 'storage_profile': profile}
+    with temporary_workdir():
+        Settings('config.ini', DEFAULT_CONFIG).set('Database', 'storage_profile', profile)
+        db = Database()
+        try:
+            result['pragmas'] = read_pragmas(db.engine, ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store'))
+            # 一括登録
+            elapsed, bulk_result = measure(db.register_books, make_catalogue(size, seed=seed))
+            result['register_books'] = summarize([elapsed], items=bulk_result['registered'])
+
+            # 1冊ずつの登録(蔵書とは別のISBNを使う)
+            latencies = []
+            for book in make_catalogue(min(queries, size), seed=seed + 1, start=size):
+                elapsed, _ = measure(db.register_book, book)
+                latencies.append(elapsed)
+            result['register_book'] = summarize(latencies)
+
+            sample = list(make_catalogue(min(1000, size), seed=seed))
+
+            # ISBNでの検索
+            latencies = []
+            for _ in range(queries):
+                elapsed, _ = measure(db.search_book, isbn=rng.choice(sample)['isbn_13'])
+                latencies.append(elapsed)
+            result['search_book[isbn]'] = summarize(latencies)
+
+            # 全件の検索(ページ分割あり)
+            latencies = []
+            for _ in range(max(1, queries // 10)):
+                elapsed, _ = measure(db.search_book, limit=200, offset=0)
+                latencies.append(elapsed)
+            result['search_book[all,limit=200]'] = summarize(latencies)
+
+            # 全件の一覧(辞書と軽量な行の比較)
+            for name, function in (('search_book[all]', db.search_book), ('search_book_rows[all]', db.search_book_rows)):
+                latencies = []
+                for _ in range(max(1, queries // 50)):
+                    elapsed, _ = measure(function)
+                    latencies.append(elapsed)
+                result[name] = summarize(latencies, items=size * len(latencies))
+
+            # 項目の組み合わせごとの検索(全文検索インデックスを使う3文字と使わない2文字)
+            for term_length in (2, 3):
+                for count in range(1, len(SEARCH_FIELDS) + 1):
+                    for fields in combinations(SEARCH_FIELDS, count):
+                        latencies = []
+                        for _ in range(queries):
+                            book = rng.choice(sample)
+                            terms = {field: make_search_term(book, field, rng, term_length) for field in fields}
+                            elapsed, _ = measure(db.search_book, **terms)
+                            latencies.append(elapsed)
+                        result[f"search_book[{'+'.join(fields)},len={term_length}]"] = summarize(latencies)
+
+            # 更新
+            latencies = []
+            for _ in range(queries):
+                book = dict(rng.choice(sample))
+                book['remarks'] = f'更新{rng.randint(0, 9999)}'
+                elapsed, _ = measure(db.update_book, **book)
+                latencies.append(elapsed)
+            result['update_book'] = summarize(latencies)
+
+            # ダウンロード用データの作成
+            elapsed, _ = measure(db.create_download_data)
+            result['create_download_data'] = summarize([elapsed], items=size)
+
+            # 一括登録中の検索
+            result['search_during_register_books'] = run_concurrent_search(db, size, queries, seed, sample)
+
+            # 削除
+            latencies = []
+            for book in rng.sample(sample, min(queries, len(sample))):
+                elapsed, _ = measure(db.delete_book, book['isbn_13'])
+                latencies.append(elapsed)
+            result['delete_book'] = summarize(latencies)
+        finally:
+            db.engine.dispose()
+            if db.search_cache is not None:
+                db.search_cache.engine.dispose()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Databaseのベンチマーク')
+    parser.add_argument('--sizes', default='1000,10000', help='蔵書の冊数(カンマ区切り、例: 1000,10000,100000,1000000)')
+    parser.add_argument('--profiles', default='default,balanced', help='ストレージのプロファイル(カンマ区切り、default/balanced/safe/fast)')
+    parser.add_argument('--queries', type=int, default=100, help='1つの処理あたりの計測回数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+    parser.add_argument('--output', default=None, help='結果の出力先(省略時は標準出力)')
+    args = parser.parse_args()
+
+    report = {
+        'benchmark': 'database',
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'queries': args.queries,
+        'seed': args.seed,
+        'results': [run_size(int(size), args.queries, args.seed, profile) for size in args.sizes.split(',') for profile in args.profiles.split(',')],
+    }
+    write_report(report, args.output)
+
+if __name__ == '__main__':
+    main()
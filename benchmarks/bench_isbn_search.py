@@ -0,0 +1,107 @@
+"""
+isbn_search_bookの応答時間のベンチマーク(書誌情報APIはシミュレータで置き換える)
+
+使い方:
+    python benchmarks/bench_isbn_search.py --isbns 100 --latency 0.3 --jitter 0.1 --error-rate 0.05 --output result.json
+
+逐次検索と並列検索のそれぞれについて、1冊あたりの検索時間(p50/p99)と1秒あたりの検索件数をJSONで出力する。
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import platform
+import time
+
+from common import measure, summarize, temporary_workdir, write_report
+from provider_simulator import SimulatorConfig, install_simulator, make_isbn_list
+
+from utils import Database, RateLimiter
+
+# 1つの条件でベンチマークを行う
+def run_scenario(name: str, config: SimulatorConfig, isbns: list[str], concurrent_search: bool, callers: int, use_cache: bool, rate_limit: bool, timeout: float) -> dict:
+    with temporary_workdir():
+        db = Database()
+        try:
+            with db.settings.batch():
+                db.settings.set('BookSearch', 'concurrent_search', concurrent_search)
+                db.settings.set('BookSearch', 'search_timeout', timeout)
+            if not use_cache:
+                db.search_cache = None
+            if not rate_limit:
+                db.rate_limiters = {api_name: RateLimiter(0) for api_name in db.rate_limiters}
+            stats = install_simulator(db, config)
+
+            def lookup(isbn):
+                return measure(db.isbn_search_book, isbn)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=callers) as executor:
+                results = list(executor.map(lookup, isbns))
+            wall = time.perf_counter() - start
+            # キャッシュの効果を見るため、同じISBNをもう一度検索する
+            repeat = [lookup(isbn) for isbn in isbns[:min(len(isbns), 20)]] if use_cache else []
+            flight_stats = db.get_isbn_search_flight_stats()
+        finally:
+            db.engine.dispose()
+            if db.search_cache is not None:
+                db.search_cache.engine.dispose()
+    latencies = [elapsed for elapsed, _ in results]
+    result = {
+        'scenario': name,
+        'concurrent_search': concurrent_search,
+        'callers': callers,
+        'use_cache': use_cache,
+        'lookup': summarize(latencies),
+        'throughput_isbn_per_s': len(isbns) / wall if wall > 0 else None,
+        'found': sum(1 for _, book_info in results if book_info is not None),
+        'simulator': stats.snapshot(),
+        'isbn_search_flight': flight_stats,
+    }
+    if repeat:
+        result['lookup_repeat'] = summarize([elapsed for elapsed, _ in repeat])
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='isbn_search_bookのベンチマーク')
+    parser.add_argument('--isbns', type=int, default=50, help='検索するISBNの数')
+    parser.add_argument('--latency', type=float, default=0.2, help='APIの平均応答時間(秒)')
+    parser.add_argument('--jitter', type=float, default=0.05, help='応答時間のばらつき(秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='エラーを返す割合')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='タイムアウトする割合')
+    parser.add_argument('--not-found-rate', type=float, default=0.0, help='見つからなかった応答を返す割合')
+    parser.add_argument('--overrides', default='{}', help='APIごとの設定(JSON、例: {"ndl": {"latency": 2.0}})')
+    parser.add_argument('--timeout', type=float, default=5.0, help='APIのタイムアウト(秒)')
+    parser.add_argument('--callers', type=int, default=1, help='同時にisbn_search_bookを呼び出す数')
+    parser.add_argument('--cache', action='store_true', help='検索結果のキャッシュを有効にする')
+    parser.add_argument('--rate-limit', action='store_true', help='設定ファイルのリクエスト数制限を有効にする')
+    parser.add_argument('--duplicates', type=int, default=1, help='同じISBNを続けて検索する回数(--callersと組み合わせて二重読み取りを再現する)')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+    parser.add_argument('--output', default=None, help='結果の出力先(省略時は標準出力)')
+    args = parser.parse_args()
+
+    config = SimulatorConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        not_found_rate=args.not_found_rate,
+        seed=args.seed,
+        overrides=json.loads(args.overrides),
+    )
+    isbns = [isbn for isbn in make_isbn_list(args.isbns) for _ in range(args.duplicates)]
+    report = {
+        'benchmark': 'isbn_search',
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'simulator': vars(config),
+        'results': [
+            run_scenario('sequential', config, isbns, False, args.callers, args.cache, args.rate_limit, args.timeout),
+            run_scenario('concurrent', config, isbns, True, args.callers, args.cache, args.rate_limit, args.timeout),
+        ],
+    }
+    write_report(report, args.output)
+
+if __name__ == '__main__':
+    main()
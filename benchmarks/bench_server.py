@@ -0,0 +1,166 @@
+"""
+APIサーバー(server.py)の負荷試験
+
+使い方:
+    # ASGIアプリケーションをプロセス内で直接呼び出す(uvicornは不要)
+    python benchmarks/bench_server.py --size 10000 --clients 1,8,32 --requests 200 --output result.json
+
+    # 起動済みのサーバーにHTTPで接続する
+    python server.py --port 8000 &
+    python benchmarks/bench_server.py --url http://127.0.0.1:8000 --clients 1,8,32 --requests 200
+
+同時に接続するクライアント数ごとに、検索・1冊の取得・更新を混ぜたリクエストを送り、
+1秒あたりのリクエスト数とp50/p99の応答時間、エラー数をJSONで出力する。
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import platform
+import random
+import time
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from common import make_catalogue, summarize, temporary_workdir, write_report
+
+SEARCH_WORDS = ['猫', '物語', '日本', 'データベース', '入門', '新潮社', '佐藤', '棚A']
+
+# 1件分のリクエストを作成する
+def make_request(rng: random.Random, isbns: list[str], write_ratio: float) -> tuple[str, str, dict]:
+    roll = rng.random()
+    if roll < write_ratio:
+        return 'PUT', f'/books/{rng.choice(isbns)}', {'remarks': f'更新{rng.randint(0, 9999)}'}
+    if roll < write_ratio + (1 - write_ratio) / 2:
+        return 'GET', f'/books/{rng.choice(isbns)}', None
+    field = rng.choice(['title', 'author', 'publisher', 'place'])
+    return 'GET', '/books?' + urlencode({field: rng.choice(SEARCH_WORDS), 'limit': 50}), None
+
+# ASGIアプリケーションを直接呼び出す
+async def call_asgi(app, method: str, path: str, body: dict) -> int:
+    path, _, query_string = path.partition('?')
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string.encode('utf-8'), 'headers': []}
+    payload = json.dumps(body).encode('utf-8') if body is not None else b''
+    status = None
+
+    async def receive():
+        return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+# プロセス内で負荷をかける
+async def run_asgi_clients(app, clients: int, requests: int, isbns: list[str], write_ratio: float, seed: int) -> dict:
+    latencies = []
+    errors = 0
+
+    async def client(index):
+        nonlocal errors
+        rng = random.Random(f'{seed}:{index}')
+        for _ in range(requests):
+            method, path, body = make_request(rng, isbns, write_ratio)
+            start = time.perf_counter()
+            status = await call_asgi(app, method, path, body)
+            latencies.append(time.perf_counter() - start)
+            if status is None or status >= 500:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(clients)))
+    wall = time.perf_counter() - start
+    return {'latency': summarize(latencies), 'requests_per_s': len(latencies) / wall if wall > 0 else None, 'errors': errors}
+
+# HTTPで負荷をかける
+def run_http_clients(url: str, clients: int, requests: int, isbns: list[str], write_ratio: float, seed: int) -> dict:
+    def client(index):
+        rng = random.Random(f'{seed}:{index}')
+        latencies = []
+        errors = 0
+        for _ in range(requests):
+            method, path, body = make_request(rng, isbns, write_ratio)
+            data = json.dumps(body).encode('utf-8') if body is not None else None
+            request = Request(url.rstrip('/') + path, data=data, method=method, headers={'Content-Type': 'application/json'})
+            start = time.perf_counter()
+            try:
+                with urlopen(request, timeout=30) as response:
+                    response.read()
+            except HTTPError as e:
+                if e.code >= 500:
+                    errors += 1
+            except OSError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(client, range(clients)))
+    wall = time.perf_counter() - start
+    latencies = [latency for client_latencies, _ in results for latency in client_latencies]
+    return {'latency': summarize(latencies), 'requests_per_s': len(latencies) / wall if wall > 0 else None, 'errors': sum(errors for _, errors in results)}
+
+def main():
+    parser = argparse.ArgumentParser(description='APIサーバーの負荷試験')
+    parser.add_argument('--url', default=None, help='起動済みのサーバーのURL(省略時はプロセス内でASGIアプリケーションを呼び出す)')
+    parser.add_argument('--size', type=int, default=10000, help='蔵書の冊数(プロセス内の場合のみ)')
+    parser.add_argument('--isbns', default=None, help='更新・取得に使うISBNの一覧のファイル(--urlの場合、省略時は検索結果から取得する)')
+    parser.add_argument('--clients', default='1,8,32', help='同時に接続するクライアント数(カンマ区切り)')
+    parser.add_argument('--requests', type=int, default=200, help='1クライアントあたりのリクエスト数')
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='更新リクエストの割合')
+    parser.add_argument('--workers', type=int, default=None, help='サーバーのデータベース用スレッド数(プロセス内の場合のみ)')
+    parser.add_argument('--seed', type=int, default=0, help='乱数のシード')
+    parser.add_argument('--output', default=None, help='結果の出力先(省略時は標準出力)')
+    args = parser.parse_args()
+
+    client_counts = [int(clients) for clients in args.clients.split(',')]
+    report = {
+        'benchmark': 'server',
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'mode': 'http' if args.url else 'asgi',
+        'requests_per_client': args.requests,
+        'write_ratio': args.write_ratio,
+        'results': [],
+    }
+    if args.url:
+        if args.isbns:
+            with open(args.isbns, encoding='utf-8') as f:
+                isbns = [line.strip() for line in f if line.strip()]
+        else:
+            with urlopen(args.url.rstrip('/') + '/books?limit=1000', timeout=30) as response:
+                isbns = [book['isbn_13'] for book in json.load(response)]
+        for clients in client_counts:
+            result = run_http_clients(args.url, clients, args.requests, isbns, args.write_ratio, args.seed)
+            report['results'].append(dict(result, clients=clients))
+    else:
+        from server import create_app
+        from utils import Database
+
+        with temporary_workdir():
+            db = Database()
+            try:
+                db.register_books(make_catalogue(args.size, seed=args.seed))
+                isbns = [book['isbn_13'] for book in make_catalogue(min(args.size, 1000), seed=args.seed)]
+                app = create_app(db, args.workers)
+                report['storage_profile'] = db.storage_profile
+                report['server_workers'] = app.max_workers
+                for clients in client_counts:
+                    result = asyncio.run(run_asgi_clients(app, clients, args.requests, isbns, args.write_ratio, args.seed))
+                    report['results'].append(dict(result, clients=clients))
+                app.close()
+            finally:
+                db.engine.dispose()
+                if db.search_cache is not None:
+                    db.search_cache.engine.dispose()
+    write_report(report, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+起動時間のベンチマーク(python -X importtimeでモジュールごとの読み込み時間を計測する)
+
+使い方:
+    python benchmarks/bench_startup.py --modules utils,csv_io,cli,EasyBookManager --repeat 3 --output result.json
+
+モジュールごとに新しいPythonプロセスで読み込み、読み込みにかかった時間の合計と、
+時間のかかったモジュールの上位(自身の時間と、読み込んだモジュールを含む累積時間)をJSONで出力する。
+pandasなどの重いモジュールが読み込まれたかどうかも出力する。
+"""
+
+import argparse
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from common import ROOT_DIR, summarize, write_report
+
+# 読み込まれたかどうかを確認する重いモジュール
+HEAVY_MODULES = ('pandas', 'chardet', 'customtkinter', 'PIL', 'sqlalchemy', 'requests', 'book_search_api')
+
+# -X importtimeの出力を解析する
+def parse_importtime(stderr: str) -> list[dict]:
+    """-X importtimeの出力を解析する
+
+    Args:
+        stderr (str): 標準エラー出力
+
+    Returns:
+        list[dict]: モジュール名、自身の読み込み時間(マイクロ秒)、累積の読み込み時間(マイクロ秒)、入れ子の深さ
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        entries.append({
+            'module': name.strip(),
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+            'depth': (len(name) - len(name.lstrip())) // 2,
+        })
+    return entries
+
+# 1つのモジュールの読み込み時間を計測する
+def measure_import(module: str) -> dict:
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT_DIR, capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'))
+    wall = time.perf_counter() - start
+    entries = parse_importtime(completed.stderr)
+    loaded = {entry['module'] for entry in entries}
+    return {
+        'returncode': completed.returncode,
+        'error': completed.stderr.strip().splitlines()[-1] if completed.returncode != 0 and completed.stderr.strip() else None,
+        'wall_s': wall,
+        'import_s': sum(entry['self_us'] for entry in entries) / 1e6,
+        'entries': entries,
+        'heavy_modules': {name: name in loaded for name in HEAVY_MODULES},
+    }
+
+# 1つのモジュールでベンチマークを行う
+def run_module(module: str, repeat: int, top: int) -> dict:
+    runs = [measure_import(module) for _ in range(repeat)]
+    last = runs[-1]
+    # 最初の実行は.pycの作成などを含むため、最後の実行の内訳を出力する
+    top_level = [entry for entry in last['entries'] if entry['depth'] == 1]
+    return {
+        'module': module,
+        'returncode': last['returncode'],
+        'error': last['error'],
+        'wall': summarize([run['wall_s'] for run in runs]),
+        'import': summarize([run['import_s'] for run in runs]),
+        'heavy_modules': last['heavy_modules'],
+        'top_cumulative': sorted(top_level, key=lambda entry: entry['cumulative_us'], reverse=True)[:top],
+        'top_self': sorted(last['entries'], key=lambda entry: entry['self_us'], reverse=True)[:top],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='起動時間のベンチマーク')
+    parser.add_argument('--modules', default='utils,csv_io,cli,EasyBookManager', help='読み込むモジュール(カンマ区切り)')
+    parser.add_argument('--repeat', type=int, default=3, help='1つのモジュールあたりの計測回数')
+    parser.add_argument('--top', type=int, default=15, help='出力する時間のかかったモジュールの数')
+    parser.add_argument('--output', default=None, help='結果の出力先(省略時は標準出力)')
+    args = parser.parse_args()
+
+    report = {
+        'benchmark': 'startup',
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': [run_module(module, args.repeat, args.top) for module in args.modules.split(',')],
+    }
+    write_report(report, args.output)
+
+if __name__ == '__main__':
+    main()
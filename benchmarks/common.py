@@ -0,0 +1,132 @@
+"""
+ベンチマーク共通の処理
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# リポジトリ直下のモジュールを読み込めるようにする
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+TITLE_WORDS = ['吾輩', '猫', '坊っちゃん', 'こころ', '銀河鉄道', '夜', '雪国', '羅生門', '人間失格', '走れ', '風', '森', '海', '山', '星', '春', '夏', '秋', '冬', '物語',
+               '入門', '実践', 'データベース', 'プログラミング', 'Python', '統計学', '機械学習', '経済', '歴史', '日本', '世界', '図鑑', '事典', 'ガイド', '完全版']
+TITLE_PARTICLES = ['の', 'と', 'へ', 'から', 'は']
+SURNAMES = ['佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本', '中村', '小林', '加藤', '吉田', '山田', '佐々木', '山口', '松本', '夏目', '芥川', '太宰', '宮沢', '川端']
+GIVEN_NAMES = ['太郎', '花子', '一郎', '健', '直子', '裕子', '誠', '漱石', '龍之介', '治', '賢治', '康成', '美咲', '翔', '大輔']
+PUBLISHERS = ['岩波書店', '新潮社', '講談社', '角川書店', '集英社', '小学館', '文藝春秋', '中央公論新社', 'オライリー・ジャパン', '技術評論社', '翔泳社', '東京大学出版会']
+SUBJECTS = ['日本文学', '小説', '随筆', '詩歌', 'コンピュータ', 'データベース', '統計', '経済学', '日本史', '世界史', '自然科学', '数学', '児童書', '美術', '音楽']
+PLACES = [f'棚{shelf}-{row}' for shelf in 'ABCDEFGH' for row in range(1, 6)]
+
+# ISBN13のチェックディジットを計算する
+def isbn13_check_digit(isbn12: str) -> str:
+    total = sum(int(digit) * (1 if index % 2 == 0 else 3) for index, digit in enumerate(isbn12))
+    return str((10 - total % 10) % 10)
+
+# ISBN10のチェックディジットを計算する
+def isbn10_check_digit(isbn9: str) -> str:
+    total = sum(int(digit) * (10 - index) for index, digit in enumerate(isbn9))
+    check = (11 - total % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+# 連番から正しいISBNの組を作成する
+def make_isbn(serial: int) -> tuple[str, str]:
+    """連番から日本の出版物のISBN10とISBN13(978-4-)を作成する
+
+    Args:
+        serial (int): 連番(0〜99999999)
+
+    Returns:
+        tuple[str, str]: ISBN10, ISBN13
+    """
+    body = f'4{serial:08d}'
+    return body + isbn10_check_digit(body), '978' + body + isbn13_check_digit('978' + body)
+
+# 架空の本の情報を作成する
+def make_book(serial: int, rng: random.Random) -> dict:
+    isbn_10, isbn_13 = make_isbn(serial)
+    title = ''.join(rng.choice(TITLE_WORDS) + rng.choice(TITLE_PARTICLES) for _ in range(rng.randint(1, 3))) + rng.choice(TITLE_WORDS)
+    return {
+        'isbn_10': isbn_10,
+        'isbn_13': isbn_13,
+        'title': title,
+        'author': rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES),
+        'publisher': rng.choice(PUBLISHERS),
+        'subject': ', '.join(rng.sample(SUBJECTS, rng.randint(1, 2))),
+        'number': str(rng.randint(1, 3)),
+        'remarks': rng.choice(['', '', '', '寄贈', '付録あり', '要修理']),
+        'place': rng.choice(PLACES),
+    }
+
+# 架空の蔵書を作成する
+def make_catalogue(size: int, seed: int=0, start: int=0):
+    """架空の蔵書を作成する
+
+    Args:
+        size (int): 冊数
+        seed (int): 乱数のシード
+        start (int): ISBNの連番の開始位置
+
+    Yields:
+        dict: 本の情報
+    """
+    rng = random.Random(seed)
+    for serial in range(start, start + size):
+        yield make_book(serial, rng)
+
+# 処理時間を集計する
+def summarize(latencies: list[float], items: int=None) -> dict:
+    """処理時間を集計する
+
+    Args:
+        latencies (list[float]): 1回ごとの処理時間(秒)
+        items (int): 処理した件数(省略時は回数)
+
+    Returns:
+        dict: 回数、合計時間、1秒あたりの処理件数、p50/p99の処理時間(ミリ秒)
+    """
+    if len(latencies) == 0:
+        return {'count': 0}
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    items = items if items is not None else len(ordered)
+    return {
+        'count': len(ordered),
+        'total_s': total,
+        'ops_per_s': items / total if total > 0 else None,
+        'p50_ms': ordered[int((len(ordered) - 1) * 0.50)] * 1000,
+        'p99_ms': ordered[int((len(ordered) - 1) * 0.99)] * 1000,
+    }
+
+# 処理時間を計測する
+def measure(function, *args, **kwargs) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+# 一時ディレクトリで実行する
+@contextmanager
+def temporary_workdir():
+    """一時ディレクトリに移動して実行する(db.sqlite3やconfig.iniは作業ディレクトリに作成されるため)"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='easybookmanager_bench_') as directory:
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(cwd)
+
+# 結果を出力する
+def write_report(report: dict, output: str=None) -> None:
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
@@ -0,0 +1,179 @@
+"""
+書誌情報APIの代わりに記録済みの応答を返すシミュレータ
+
+Database.book_search_apisのクラスを置き換えることで、ネットワークに接続せずに
+isbn_search_bookを実行できる。応答時間・ばらつき・エラー・タイムアウトを設定できる。
+
+    db = Database()
+    install_simulator(db, SimulatorConfig(latency=0.2, jitter=0.05, error_rate=0.01))
+"""
+
+from dataclasses import dataclass, field
+import random
+import threading
+import time
+
+from common import make_isbn
+
+# 各APIの記録済み応答(isbn_search_bookが解析する形式)
+RECORDED_RESPONSES = {
+    'ndl': {
+        'searchRetrieveResponse': {
+            'records': {
+                'record': [{
+                    'recordData': {
+                        'srw_dc:dc': {
+                            'dc:title': '吾輩は猫である',
+                            'dc:creator': ['夏目, 漱石, 1867-1916'],
+                            'dc:publisher': '新潮社',
+                            'dc:subject': ['小説', '日本文学'],
+                        },
+                    },
+                }],
+            },
+        },
+    },
+    'google_books': {
+        'items': [{
+            'volumeInfo': {
+                'title': '吾輩は猫である',
+                'authors': ['夏目漱石'],
+                'publisher': '新潮社',
+                'categories': ['Fiction'],
+            },
+        }],
+    },
+    'openbd': [{
+        'summary': {
+            'title': '吾輩は猫である',
+            'author': '夏目漱石／著',
+            'publisher': '新潮社',
+        },
+    }],
+    'open_library': {
+        'title': 'Wagahai wa neko de aru',
+        'authors': [{'key': '/authors/OL1A'}, {'key': '/authors/OL2A'}],
+        'publishers': ['Shinchōsha'],
+        'subjects': ['Japanese fiction'],
+    },
+}
+RECORDED_AUTHORS = {
+    '/authors/OL1A': {'name': 'Natsume Sōseki'},
+    '/authors/OL2A': {'name': 'Sōseki Natsume'},
+}
+# 見つからなかった場合の応答
+NOT_FOUND_RESPONSES = {
+    'ndl': {'searchRetrieveResponse': {'numberOfRecords': '0'}},
+    'google_books': {'totalItems': 0},
+    'openbd': [None],
+    'open_library': None,
+}
+
+class SimulatedTimeout(Exception):
+    pass
+
+class SimulatedError(Exception):
+    pass
+
+@dataclass
+class SimulatorConfig:
+    latency: float = 0.1            # 平均応答時間(秒)
+    jitter: float = 0.0             # 応答時間のばらつき(秒、一様分布の幅の半分)
+    error_rate: float = 0.0         # エラーを返す割合
+    timeout_rate: float = 0.0       # タイムアウトする割合(タイムアウト時間だけ待ってから失敗する)
+    not_found_rate: float = 0.0     # 見つからなかった応答を返す割合
+    seed: int = 0
+    # APIごとの設定(省略したAPIは上の値を使う)
+    overrides: dict = field(default_factory=dict)
+
+    def for_api(self, api_name: str) -> 'SimulatorConfig':
+        values = self.overrides.get(api_name)
+        if not values:
+            return self
+        config = SimulatorConfig(self.latency, self.jitter, self.error_rate, self.timeout_rate, self.not_found_rate, self.seed)
+        for key, value in values.items():
+            setattr(config, key, value)
+        return config
+
+class SimulatorStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+
+    def record(self, api_name: str, outcome: str) -> None:
+        with self.lock:
+            counts = self.requests.setdefault(api_name, {})
+            counts[outcome] = counts.get(outcome, 0) + 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {api_name: dict(counts) for api_name, counts in self.requests.items()}
+
+# APIごとのシミュレータクラスを作成する
+def make_simulated_api(api_name: str, config: SimulatorConfig, stats: SimulatorStats):
+    api_config = config.for_api(api_name)
+    rng = random.Random(f'{api_config.seed}:{api_name}')
+    rng_lock = threading.Lock()
+
+    class SimulatedAPI:
+        def __init__(self, timeout: float=5, session=None):
+            self.timeout = timeout
+            self.session = session
+
+        def wait(self) -> str:
+            with rng_lock:
+                roll = rng.random()
+                delay = max(0.0, api_config.latency + rng.uniform(-api_config.jitter, api_config.jitter))
+            if roll < api_config.timeout_rate:
+                time.sleep(self.timeout)
+                return 'timeout'
+            time.sleep(min(delay, self.timeout))
+            if delay > self.timeout:
+                return 'timeout'
+            roll -= api_config.timeout_rate
+            if roll < api_config.error_rate:
+                return 'error'
+            roll -= api_config.error_rate
+            if roll < api_config.not_found_rate:
+                return 'not_found'
+            return 'ok'
+
+        def respond(self, outcome: str, response):
+            stats.record(api_name, outcome)
+            if outcome == 'timeout':
+                raise SimulatedTimeout(f'{api_name} timed out')
+            if outcome == 'error':
+                raise SimulatedError(f'{api_name} returned an error')
+            if outcome == 'not_found':
+                return NOT_FOUND_RESPONSES[api_name]
+            return response
+
+        def isbn_search(self, isbn: str):
+            return self.respond(self.wait(), RECORDED_RESPONSES[api_name])
+
+        def author_search(self, author_key: str):
+            return self.respond(self.wait(), RECORDED_AUTHORS.get(author_key))
+
+    SimulatedAPI.__name__ = f'Simulated{api_name}API'
+    return SimulatedAPI
+
+# Databaseのクライアントをシミュレータに置き換える
+def install_simulator(db, config: SimulatorConfig) -> SimulatorStats:
+    """Databaseの書誌情報APIクライアントをシミュレータに置き換える
+
+    Args:
+        db (Database): データベース
+        config (SimulatorConfig): シミュレータの設定
+
+    Returns:
+        SimulatorStats: APIごとの応答結果の集計
+    """
+    stats = SimulatorStats()
+    for api_name in list(db.book_search_apis.keys()):
+        db.book_search_apis[api_name] = make_simulated_api(api_name, config, stats)
+    db.search_api_clients.clear()
+    return stats
+
+# ベンチマーク用のISBNを作成する
+def make_isbn_list(count: int, start: int=50000000) -> list[str]:
+    return [make_isbn(serial)[1] for serial in range(start, start + count)]
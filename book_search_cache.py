@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta
+from logging import getLogger
+import json
+import threading
+
+from sqlalchemy import create_engine, Column, String, Float, Text, DateTime, delete, func, tuple_, update
+from sqlalchemy.orm import sessionmaker, declarative_base
+
+from sqlite_profile import apply_pragmas
+
+# キャッシュ用データベースモデルの定義
+CACHE_BASE = declarative_base()
+
+# 各APIの結果をまとめた本の情報を保存するときのAPI名(事前取得で使う)
+MERGED_PROVIDER = "merged"
+
+## APIの検索結果
+class ProviderResponse(CACHE_BASE):
+    __tablename__ = "provider_responses"
+
+    provider = Column(String, primary_key=True)         # API名
+    isbn_13 = Column(String, primary_key=True)          # ISBN-13
+    data = Column(Text, nullable=True)                  # 検索結果(JSON、見つからなかった場合はNULL)
+    latency = Column(Float)                             # 検索にかかった時間(秒)
+    expires_at = Column(DateTime, index=True)           # 有効期限
+    accessed_at = Column(DateTime, index=True)          # 最終参照日時
+
+class BookSearchCache:
+    def __init__(self, cache_path: str, ttl: float, negative_ttl: float, max_entries: int, pragmas: dict=None):
+        """APIの検索結果を(API名, ISBN13)ごとにSQLiteへ保存するキャッシュ
+
+        Args:
+            cache_path (str): キャッシュファイルのパス
+            ttl (float): 検索結果の有効期間(秒)
+            negative_ttl (float): 見つからなかった結果の有効期間(秒)
+            max_entries (int): 保存する最大件数(超えた場合は参照が古いものから削除)
+            pragmas (dict): 接続ごとに設定するPRAGMA(WALなど)
+        """
+        self.logger = getLogger(__name__)
+        self.cache_path = cache_path
+        self.ttl = timedelta(seconds=ttl)
+        self.negative_ttl = timedelta(seconds=negative_ttl)
+        self.max_entries = max_entries
+        self.engine = create_engine(f"sqlite:///{cache_path}")
+        apply_pragmas(self.engine, pragmas or {})
+        self.session_local = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        CACHE_BASE.metadata.create_all(bind=self.engine)
+
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        # 削除処理は書き込みの度ではなく一定件数ごとに行う
+        self.evict_interval = 100
+        self.writes = 0
+        # 最終参照日時は参照の度ではなく、前回の更新から一定時間が経った場合のみ更新する
+        self.touch_interval = timedelta(hours=1)
+
+        self.evict()
+
+    # キャッシュから検索結果を取得する
+    def get(self, provider: str, isbn_13: str, count_stats: bool=True) -> tuple[bool, dict]:
+        """キャッシュから検索結果を取得する
+
+        Args:
+            provider (str): API名
+            isbn_13 (str): ISBN13
+            count_stats (bool): ヒット数・ミス数に数えるかどうか(APIの検索結果以外を読む場合はFalse)
+
+        Returns:
+            tuple[bool, dict]: キャッシュに存在したかどうかと検索結果(見つからなかった結果の場合はNone)
+        """
+        now = datetime.now()
+        session = self.session_local()
+        try:
+            response = session.get(ProviderResponse, (provider, isbn_13))
+            if response is None or response.expires_at <= now:
+                if count_stats:
+                    with self.lock:
+                        self.misses += 1
+                return False, None
+            data = json.loads(response.data) if response.data is not None else None
+            latency = response.latency or 0.0
+            need_touch = response.accessed_at is None or now - response.accessed_at >= self.touch_interval
+        except Exception:
+            self.logger.exception("Failed to read search cache: provider=%s, isbn_13=%s", provider, isbn_13)
+            session.rollback()
+            if count_stats:
+                with self.lock:
+                    self.misses += 1
+            return False, None
+        finally:
+            session.close()
+        if need_touch:
+            self.touch(provider, isbn_13, now)
+        if count_stats:
+            with self.lock:
+                self.hits += 1
+                self.saved_seconds += latency
+        return True, data
+
+    # 最終参照日時を更新する
+    def touch(self, provider: str, isbn_13: str, now: datetime) -> None:
+        """最終参照日時を更新する(削除の順番に使うだけのため、書き込めなかった場合も検索結果はそのまま使う)"""
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(update(ProviderResponse).where(ProviderResponse.provider == provider, ProviderResponse.isbn_13 == isbn_13).values(accessed_at=now))
+        except Exception:
+            self.logger.debug("Failed to update search cache access time: provider=%s, isbn_13=%s", provider, isbn_13, exc_info=True)
+
+    # 検索結果をキャッシュに保存する
+    def set(self, provider: str, isbn_13: str, data: dict, latency: float) -> None:
+        """検索結果をキャッシュに保存する
+
+        Args:
+            provider (str): API名
+            isbn_13 (str): ISBN13
+            data (dict): 検索結果(見つからなかった場合はNone)
+            latency (float): 検索にかかった時間(秒)
+        """
+        now = datetime.now()
+        session = self.session_local()
+        try:
+            session.merge(ProviderResponse(
+                provider=provider,
+                isbn_13=isbn_13,
+                data=json.dumps(data, ensure_ascii=False) if data is not None else None,
+                latency=latency,
+                expires_at=now + (self.ttl if data is not None else self.negative_ttl),
+                accessed_at=now,
+            ))
+            session.commit()
+        except Exception:
+            self.logger.exception("Failed to write search cache: provider=%s, isbn_13=%s", provider, isbn_13)
+            session.rollback()
+            return
+        finally:
+            session.close()
+        with self.lock:
+            self.writes += 1
+            need_evict = self.writes % self.evict_interval == 0
+        if need_evict:
+            self.evict()
+
+    # 期限切れと上限を超えた検索結果を削除する
+    def evict(self) -> None:
+        """期限切れの検索結果と、最大件数を超えた分の参照が古い検索結果を削除する"""
+        session = self.session_local()
+        try:
+            session.execute(delete(ProviderResponse).where(ProviderResponse.expires_at <= datetime.now()))
+            overflow = session.query(func.count(ProviderResponse.isbn_13)).scalar() - self.max_entries
+            if overflow > 0:
+                keys = session.query(ProviderResponse.provider, ProviderResponse.isbn_13).order_by(ProviderResponse.accessed_at).limit(overflow).all()
+                session.execute(delete(ProviderResponse).where(tuple_(ProviderResponse.provider, ProviderResponse.isbn_13).in_([tuple(key) for key in keys])))
+            session.commit()
+        except Exception:
+            self.logger.exception("Failed to evict search cache")
+            session.rollback()
+        finally:
+            session.close()
+
+    # キャッシュを全て削除する
+    def clear(self) -> None:
+        """キャッシュを全て削除する"""
+        session = self.session_local()
+        try:
+            session.execute(delete(ProviderResponse))
+            session.commit()
+        finally:
+            session.close()
+
+    # キャッシュの統計情報を取得する
+    def stats(self) -> dict:
+        """キャッシュの統計情報を取得する
+
+        Returns:
+            dict: ヒット数、ミス数、ヒット率、ヒットにより省略できた通信時間(秒)、保存件数
+        """
+        session = self.session_local()
+        try:
+            entries = session.query(func.count(ProviderResponse.isbn_13)).scalar()
+        finally:
+            session.close()
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total > 0 else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "entries": entries,
+            }
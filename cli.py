@@ -0,0 +1,333 @@
+"""
+EasyBookManagerのコマンドライン版(画面を使わずに一括処理を行う)
+
+使い方:
+    python cli.py lookup 9784101010014 9784003101018
+    cat isbn.txt | python cli.py lookup --workers 8 --register > books.jsonl
+    python cli.py import books.csv
+    python cli.py import --format isbn isbn.txt --workers 8
+    python cli.py import --format jsonl - < books.jsonl
+    python cli.py export --format jsonl > books.jsonl
+    python cli.py export -o books.csv.gz --encoding shift_jis
+    python cli.py search --title 猫 --limit 20 --format csv
+    python cli.py stats
+    python cli.py vacuum
+    python cli.py prefetch -i invoice_isbn.txt --rate 2 --workers 2
+
+入出力の"-"は標準入力・標準出力を表す。customtkinter・PIL・pandasは必要になるまで読み込まない。
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import gzip
+import json
+import os
+import sys
+
+from metrics import METRICS
+
+# 出力するファイルを開く
+def open_output(path: str, encoding: str='utf-8'):
+    if path == '-':
+        sys.stdout.reconfigure(encoding=encoding, newline='')
+        return sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding=encoding, errors='replace', newline='')
+    return open(path, 'w', encoding=encoding, errors='replace', newline='')
+
+# 入力するファイルを開く
+def open_input(path: str, encoding: str='utf-8-sig'):
+    if path == '-':
+        sys.stdin.reconfigure(encoding=encoding)
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding=encoding)
+    return open(path, 'r', encoding=encoding)
+
+# 行をJSON LinesまたはCSVで書き出す
+class RecordWriter:
+    def __init__(self, f, output_format: str, columns: list[str]):
+        """行をJSON LinesまたはCSVで書き出す
+
+        Args:
+            f: 出力先
+            output_format (str): "jsonl"または"csv"
+            columns (list[str]): 列名(CSVのヘッダーと、JSONのキー)
+        """
+        self.f = f
+        self.output_format = output_format
+        self.columns = columns
+        if output_format == 'csv':
+            self.writer = csv.writer(f)
+            self.writer.writerow(columns)
+
+    def write(self, values) -> None:
+        if self.output_format == 'csv':
+            self.writer.writerow(values)
+        else:
+            self.f.write(json.dumps(dict(zip(self.columns, values)), ensure_ascii=False))
+            self.f.write('\n')
+
+# 進捗を標準エラー出力に表示する
+def print_progress(progress: dict) -> None:
+    print(f"\r処理済み: {progress['processed']}件 ({progress['isbn_per_second']:.1f}件/秒)", end='', file=sys.stderr, flush=True)
+
+# CSVの読み込み状況を表示する
+def print_csv_progress(rows: int) -> None:
+    print(f"\r読み込み済み: {rows}行", end='', file=sys.stderr, flush=True)
+
+# ISBNを検索する
+def command_lookup(db, args) -> int:
+    from batch_import import iter_isbns
+    from book_search_api import calc_both_isbn
+    from utils import BOOK_INFO_COLUMNS
+
+    isbns = args.isbns if args.isbns else iter_isbns(open_input(args.input))
+    columns = ['status'] + list(BOOK_INFO_COLUMNS)
+    out = open_output(args.output)
+    writer = RecordWriter(out, args.format, columns)
+    registered = []
+    failures = 0
+
+    def resolve(isbn):
+        try:
+            isbn_10, isbn_13 = calc_both_isbn(isbn)
+        except ValueError:
+            return 'invalid', {'isbn_10': '', 'isbn_13': isbn}
+        if not args.no_check and db.check_book_exist(isbn_13):
+            return 'exists', {'isbn_10': isbn_10, 'isbn_13': isbn_13}
+        # APIへの問い合わせ中はデータベースの接続を持たない
+        book_info = db.isbn_search_book(isbn_13, check_exists=False)
+        if book_info is None:
+            return 'unresolved', db.merge_book_info(isbn_10, isbn_13, [])
+        return 'resolved', book_info
+
+    def emit(status, book_info):
+        writer.write([status] + [book_info.get(column, '') for column in BOOK_INFO_COLUMNS])
+        if args.register and (status == 'resolved' or (status == 'unresolved' and args.register_unresolved)):
+            registered.append(book_info)
+            if len(registered) >= args.batch_size:
+                flush()
+
+    def flush():
+        nonlocal failures
+        if registered:
+            failures += len(db.register_books(registered, batch_size=args.batch_size)['conflicts'])
+            registered.clear()
+
+    # 入力の順番どおりに出力しつつ、同時にworkers件まで検索する
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='lookup') as executor:
+        pending = deque()
+        for isbn in isbns:
+            pending.append(executor.submit(resolve, isbn))
+            if len(pending) >= args.workers * 2:
+                emit(*pending.popleft().result())
+        while pending:
+            emit(*pending.popleft().result())
+    flush()
+    out.flush()
+    return 1 if failures else 0
+
+# ファイルを取り込む
+def command_import(db, args) -> int:
+    if args.format == 'csv':
+        # pandasを使うため、CSVを取り込む場合のみ読み込む
+        import csv_io
+        if args.input == '-':
+            print('CSVの取り込みには標準入力を使えません', file=sys.stderr)
+            return 2
+        result = csv_io.import_csv(db, args.input, progress_callback=None if args.quiet else print_csv_progress)
+    elif args.format == 'isbn':
+        from batch_import import BatchIsbnImporter
+        importer = BatchIsbnImporter(db, max_workers=args.workers, batch_size=args.batch_size, register_unresolved=args.register_unresolved)
+        source = open_input(args.input) if args.input == '-' else args.input
+        result = importer.run(source, progress_callback=None if args.quiet else print_progress)
+    else:
+        from book_search_api import calc_both_isbn
+        from utils import BOOK_INFO_COLUMNS
+
+        invalid = 0
+
+        def books():
+            nonlocal invalid
+            with open_input(args.input) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        # ISBNは主キーになるため、CSVの取り込みと同じく正規化し、正しくないものは登録しない
+                        try:
+                            isbn_10, isbn_13 = calc_both_isbn(str(record.get('isbn_13') or record.get('isbn_10') or record.get('isbn') or ''))
+                        except ValueError:
+                            invalid += 1
+                            continue
+                        book_data = {column: '' if record.get(column) is None else str(record.get(column)) for column in BOOK_INFO_COLUMNS}
+                        book_data['isbn_10'] = isbn_10
+                        book_data['isbn_13'] = isbn_13
+                        yield book_data
+
+        result = db.register_books(books(), batch_size=args.batch_size)
+        result = {'registered': result['registered'], 'conflicts': result['conflicts'], 'invalid': invalid}
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+# 本の情報を書き出す
+def command_export(db, args) -> int:
+    from utils import DOWNLOAD_COLUMNS
+
+    columns = list(DOWNLOAD_COLUMNS) if args.format == 'csv' else list(DOWNLOAD_COLUMNS.values())
+    out = open_output(args.output, args.encoding)
+    try:
+        writer = RecordWriter(out, args.format, columns)
+        for row in db.iter_download_data(args.batch_size):
+            writer.write(row)
+    finally:
+        if out is sys.stdout:
+            out.flush()
+        else:
+            out.close()
+    return 0
+
+# 本を検索する
+def command_search(db, args) -> int:
+    from book_search_api import calc_both_isbn
+    from utils import BookRow
+
+    if args.isbn:
+        try:
+            calc_both_isbn(args.isbn)
+        except ValueError:
+            print(f'ISBNが正しくありません: {args.isbn}', file=sys.stderr)
+            return 2
+    rows = db.search_book_rows(isbn=args.isbn, title=args.title, author=args.author, publisher=args.publisher, subject=args.subject, place=args.place, remarks=args.remarks, limit=args.limit, offset=args.offset)
+    out = open_output(args.output)
+    writer = RecordWriter(out, args.format, list(BookRow._fields))
+    for row in rows:
+        writer.write(row)
+    out.flush()
+    return 0
+
+# ISBNの一覧の本の情報を事前に取得する
+def command_prefetch(db, args) -> int:
+    from batch_import import iter_isbns
+    from prefetch import IsbnPrefetcher
+
+    isbns = args.isbns if args.isbns else iter_isbns(open_input(args.input))
+    prefetcher = IsbnPrefetcher(db, rate=args.rate, max_workers=args.workers)
+    result = prefetcher.run(isbns, progress_callback=None if args.quiet else print_progress)
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(json.dumps(result, ensure_ascii=False))
+    return 1 if result['failed'] else 0
+
+# 統計情報を表示する
+def command_stats(db, args) -> int:
+    from sqlite_profile import read_pragmas
+
+    stats = {
+        'database': db.database_path,
+        'books': db.count_books(),
+        'storage_profile': db.storage_profile,
+        'pragmas': read_pragmas(db.engine, ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store')),
+        'full_text_search': db.fts_enabled,
+        'search_cache': db.get_search_cache_stats(),
+        'provider_health': db.get_provider_health(),
+    }
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    return 0
+
+# データベースを最適化する
+def command_vacuum(db, args) -> int:
+    db.vacuum()
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='cli.py', description='EasyBookManagerのコマンドライン版')
+    parser.add_argument('-C', '--directory', default=None, help='作業ディレクトリ(config.iniとデータベースの場所)')
+    parser.add_argument('--log-level', default=None, help='ログのレベル(省略時は設定ファイルの値)')
+    parser.add_argument('--metrics', default=None, help='処理時間の計測結果の出力先(.jsonまたは.prom)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='進捗を表示しない')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    lookup = subparsers.add_parser('lookup', help='ISBNから本の情報を検索する')
+    lookup.add_argument('isbns', nargs='*', help='ISBN(省略時は--inputから1行1件で読み込む)')
+    lookup.add_argument('-i', '--input', default='-', help='ISBNの一覧のファイル(既定は標準入力)')
+    lookup.add_argument('-o', '--output', default='-', help='出力先(既定は標準出力)')
+    lookup.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl', help='出力形式')
+    lookup.add_argument('-w', '--workers', type=int, default=4, help='同時に検索するISBNの数')
+    lookup.add_argument('--register', action='store_true', help='見つかった本を登録する')
+    lookup.add_argument('--register-unresolved', action='store_true', help='情報が見つからなかった本もISBNのみで登録する')
+    lookup.add_argument('--no-check', action='store_true', help='登録済みかどうかを確認しない')
+    lookup.add_argument('--batch-size', type=int, default=100, help='まとめて登録する本の数')
+    lookup.set_defaults(function=command_lookup)
+
+    import_parser = subparsers.add_parser('import', help='ファイルから本を登録する')
+    import_parser.add_argument('input', help='ファイル("-"は標準入力、csv以外のみ)')
+    import_parser.add_argument('--format', choices=('csv', 'isbn', 'jsonl'), default='csv', help='csv: エクスポートしたCSV、isbn: 1行1件のISBN、jsonl: JSON Lines')
+    import_parser.add_argument('-w', '--workers', type=int, default=None, help='同時に検索するISBNの数(isbnのみ、省略時は設定ファイルの値)')
+    import_parser.add_argument('--batch-size', type=int, default=None, help='まとめて登録する本の数(省略時は設定ファイルの値)')
+    import_parser.add_argument('--register-unresolved', action='store_true', help='情報が見つからなかった本もISBNのみで登録する(isbnのみ)')
+    import_parser.set_defaults(function=command_import)
+
+    export = subparsers.add_parser('export', help='本の情報を書き出す')
+    export.add_argument('-o', '--output', default='-', help='出力先(既定は標準出力、.gzの場合は圧縮する)')
+    export.add_argument('--format', choices=('csv', 'jsonl'), default='csv', help='出力形式')
+    export.add_argument('--encoding', default='utf-8', help='文字コード')
+    export.add_argument('--batch-size', type=int, default=1000, help='1回にデータベースから読み込む件数')
+    export.set_defaults(function=command_export)
+
+    search = subparsers.add_parser('search', help='登録されている本を検索する')
+    for name in ('isbn', 'title', 'author', 'publisher', 'subject', 'place', 'remarks'):
+        search.add_argument(f'--{name}', default='')
+    search.add_argument('--limit', type=int, default=None, help='最大件数')
+    search.add_argument('--offset', type=int, default=0, help='開始位置')
+    search.add_argument('-o', '--output', default='-', help='出力先(既定は標準出力)')
+    search.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl', help='出力形式')
+    search.set_defaults(function=command_search)
+
+    prefetch = subparsers.add_parser('prefetch', help='ISBNの一覧の本の情報を事前に取得し、読み取り時にすぐ使えるよう保存する')
+    prefetch.add_argument('isbns', nargs='*', help='ISBN(省略時は--inputから1行1件で読み込む)')
+    prefetch.add_argument('-i', '--input', default='-', help='ISBNの一覧のファイル(既定は標準入力)')
+    prefetch.add_argument('--rate', type=float, default=None, help='1秒あたりに検索を開始するISBNの数(省略時は設定ファイルの値)')
+    prefetch.add_argument('-w', '--workers', type=int, default=None, help='同時に検索するISBNの数(省略時は設定ファイルの値)')
+    prefetch.set_defaults(function=command_prefetch)
+
+    stats = subparsers.add_parser('stats', help='登録件数やキャッシュ・APIの統計情報を表示する')
+    stats.set_defaults(function=command_stats)
+
+    vacuum = subparsers.add_parser('vacuum', help='データベースを最適化し、全文検索インデックスを作り直す')
+    vacuum.set_defaults(function=command_vacuum)
+    return parser
+
+def main(argv: list[str]=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.directory:
+        os.chdir(args.directory)
+
+    from log_config import setup_logging_from_settings, setup_logging
+    from utils import Database
+
+    db = Database()
+    if args.log_level:
+        setup_logging(args.log_level, use_queue=db.settings.get('Logging', 'use_queue'))
+    else:
+        setup_logging_from_settings(db.settings)
+    if args.metrics:
+        METRICS.enabled = True
+    try:
+        return args.function(db, args)
+    except BrokenPipeError:
+        # headなどで出力が途中で閉じられた場合
+        sys.stderr.close()
+        return 0
+    finally:
+        if args.metrics:
+            db.dump_metrics(args.metrics)
+        if db.provider_health is not None:
+            db.provider_health.save()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import codecs
+import csv
+import gzip
+from logging import getLogger
+
+from book_search_api import calc_both_isbn
+
+from utils import Database, DOWNLOAD_COLUMNS
+from metrics import timed
+
+logger = getLogger(__name__)
+
+# CSVの列名と本の情報の項目の対応
+CSV_COLUMNS = {
+    'isbn': 'isbn',
+    'タイトル': 'title',
+    '著者': 'author',
+    '出版社': 'publisher',
+    '件名標目': 'subject',
+    '保管場所': 'place',
+    '所持数': 'number',
+    '備考': 'remarks',
+}
+OK_ENCODING_LIST = ['utf-8', 'shift_jis', 'cp932']
+
+# ファイルの文字コードを判定する
+def detect_encoding(file_path: str, sample_size: int=65536) -> str:
+    """ファイルの先頭から文字コードを判定し、ファイル全体をその文字コードで読めるか確認する
+
+    先頭がASCIIのみで途中からShift_JISになるファイルなどは先頭だけでは判定を誤るため、
+    ファイル全体を読めなかった場合はUTF-8、CP932(Shift_JISの拡張)の順に読めるものを使う。
+    登録を始める前に確認するため、途中まで登録してから読み込みに失敗することはない。
+
+    Args:
+        file_path (str): ファイルのパス
+        sample_size (int): 判定に使う先頭のバイト数
+
+    Returns:
+        str: 文字コード(判定できなかった場合はNone)
+    """
+    # chardetとpandasは起動時間を短くするため、使うときに読み込む
+    from chardet import detect
+
+    with open(file_path, 'rb') as f:
+        encoding = detect(f.read(sample_size))['encoding']
+    if encoding is None:
+        return None
+    encoding = encoding.lower()
+    # 先頭がASCIIのみの場合はUTF-8として扱う
+    if encoding == 'ascii':
+        encoding = 'utf-8'
+    if encoding not in OK_ENCODING_LIST:
+        return encoding
+    for candidate in [encoding] + [candidate for candidate in ('utf-8', 'cp932') if candidate != encoding]:
+        if can_decode(file_path, candidate):
+            if candidate != encoding:
+                logger.info("Encoding detected from the first %s bytes does not fit the whole file: detected=%s, using=%s", sample_size, encoding, candidate)
+            return candidate
+    return encoding
+
+# ファイル全体を指定した文字コードで読めるか確認する
+def can_decode(file_path: str, encoding: str, block_size: int=1048576) -> bool:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with open(file_path, 'rb') as f:
+        try:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                decoder.decode(block)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            return False
+    return True
+
+# ISBNをISBN10とISBN13に変換する
+def normalize_isbn(isbn) -> tuple[str, str]:
+    try:
+        return calc_both_isbn(isbn)
+    except:
+        return None, None
+
+# CSVを分割して読み込み、本の情報に変換する
+def iter_csv_books(file_path: str, encoding: str, chunksize: int=5000, stats: dict=None):
+    """CSVを分割して読み込み、本の情報に変換する
+
+    Args:
+        file_path (str): ファイルのパス
+        encoding (str): 文字コード
+        chunksize (int): 1回に読み込む行数
+        stats (dict): 読み込んだ行数(rows)とISBNが正しくない行数(invalid)の集計先
+
+    Yields:
+        dict: 本の情報
+    """
+    import pandas as pd
+
+    if stats is None:
+        stats = {}
+    stats.setdefault('rows', 0)
+    stats.setdefault('invalid', 0)
+    for chunk in pd.read_csv(file_path, encoding=encoding, chunksize=chunksize, dtype=str, keep_default_na=False):
+        if len(chunk) == 0:
+            continue
+        chunk = chunk.rename(columns=CSV_COLUMNS)
+        if 'remarks' not in chunk.columns:
+            chunk['remarks'] = ''
+        isbn = chunk['isbn'].str.strip().map(normalize_isbn)
+        chunk['isbn_10'] = isbn.str[0]
+        chunk['isbn_13'] = isbn.str[1]
+        number = pd.to_numeric(chunk['number'], errors='coerce')
+        chunk['number'] = number.dropna().astype('int64').astype(str).reindex(chunk.index, fill_value='')
+        valid = chunk['isbn_10'].notna()
+        stats['rows'] += len(chunk)
+        stats['invalid'] += int((~valid).sum())
+        chunk = chunk.loc[valid, ['isbn_10', 'isbn_13', 'title', 'author', 'publisher', 'subject', 'place', 'remarks', 'number']].fillna('')
+        yield from chunk.to_dict('records')
+
+# CSVをインポートする
+@timed('import_csv')
+def import_csv(db: Database, file_path: str, chunksize: int=5000, progress_callback=None) -> dict:
+    """CSVを分割して読み込み、まとめて登録する
+
+    Args:
+        db (Database): データベース
+        file_path (str): ファイルのパス
+        chunksize (int): 1回に読み込む行数
+        progress_callback (callable): 読み込んだ行数を受け取る関数
+
+    Returns:
+        dict: 読み込んだ行数(rows)、登録した本の数(registered)、登録済みなどでスキップした本の数(skipped)、ISBNが正しくない行数(invalid)
+    """
+    encoding = detect_encoding(file_path)
+    if encoding not in OK_ENCODING_LIST:
+        raise ValueError(f"Unsupported encoding: {encoding}")
+    logger.info("Importing CSV: file_path=%s, encoding=%s", file_path, encoding)
+    stats = {}
+
+    def books():
+        for index, book_info in enumerate(iter_csv_books(file_path, encoding, chunksize, stats)):
+            if progress_callback is not None and index % chunksize == 0:
+                progress_callback(stats['rows'])
+            yield book_info
+
+    result = db.register_books(books())
+    return {
+        'rows': stats['rows'],
+        'registered': result['registered'],
+        'skipped': len(result['conflicts']),
+        'invalid': stats['invalid'],
+    }
+
+# CSVをエクスポートする
+@timed('export_csv')
+def export_csv(db: Database, file_path: str, encoding: str, compress: bool=False, batch_size: int=1000, progress_callback=None) -> int:
+    """本の情報を全件読み込まずに少しずつCSVへ書き出す
+
+    Args:
+        db (Database): データベース
+        file_path (str): ファイルのパス
+        encoding (str): 文字コード
+        compress (bool): gzipで圧縮するかどうか
+        batch_size (int): 1回にデータベースから読み込む件数
+        progress_callback (callable): 書き出した件数と全件数を受け取る関数
+
+    Returns:
+        int: 書き出した件数
+    """
+    logger.info("Exporting CSV: file_path=%s, encoding=%s, compress=%s", file_path, encoding, compress)
+    total = db.count_books()
+    written = 0
+    if compress:
+        f = gzip.open(file_path, 'wt', encoding=encoding, newline='')
+    else:
+        f = open(file_path, 'w', encoding=encoding, newline='')
+    with f:
+        writer = csv.writer(f)
+        writer.writerow(DOWNLOAD_COLUMNS.keys())
+        for row in db.iter_download_data(batch_size):
+            writer.writerow(row)
+            written += 1
+            if progress_callback is not None and written % batch_size == 0:
+                progress_callback(written, total)
+    if progress_callback is not None:
+        progress_callback(written, total)
+    return written
@@ -0,0 +1,79 @@
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+class HostOverrideAdapter(HTTPAdapter):
+    def __init__(self, host_overrides: dict=None, **kwargs):
+        """指定したホストへのリクエストを別のURLへ送るアダプタ(ローカルのスタブサーバーでの確認用)
+
+        Args:
+            host_overrides (dict): ホスト名と送り先のURL(スキームとホスト、ポートのみ使用)の対応
+        """
+        self.host_overrides = host_overrides or {}
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        override = self.host_overrides.get(url.hostname)
+        if override is not None:
+            override_url = urlsplit(override)
+            request.url = urlunsplit((override_url.scheme, override_url.netloc, url.path, url.query, url.fragment))
+        return super().send(request, **kwargs)
+
+# ホストの置き換え設定を読み込む
+def parse_host_overrides(value: str) -> dict:
+    """ホストの置き換え設定を読み込む
+
+    Args:
+        value (str): "ホスト名=URL"をカンマ区切りで並べた文字列
+
+    Returns:
+        dict: ホスト名と送り先のURLの対応
+    """
+    host_overrides = {}
+    for item in value.split(','):
+        if '=' in item:
+            host, url = item.split('=', 1)
+            host_overrides[host.strip()] = url.strip()
+    return host_overrides
+
+# APIクライアントで共有するHTTPセッションを作成する
+def create_http_session(pool_maxsize: int, host_overrides: dict=None, pool_connections: int=4) -> requests.Session:
+    """APIクライアントで共有するHTTPセッションを作成する
+
+    接続はホストごとにプールされ、Keep-Aliveで再利用される。
+
+    Args:
+        pool_maxsize (int): ホストごとの最大接続数
+        host_overrides (dict): ホスト名と送り先のURLの対応
+        pool_connections (int): 保持する接続プールの数(問い合わせるホストの数)
+
+    Returns:
+        requests.Session: HTTPセッション
+    """
+    session = requests.Session()
+    # 接続数が上限に達した場合は新しい接続を作らずに空くのを待つ
+    adapter = HostOverrideAdapter(host_overrides, pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+# APIクライアントに共有のHTTPセッションを使わせる
+def attach_http_session(client, session: requests.Session) -> bool:
+    """コンストラクタでセッションを受け取らないAPIクライアントに、共有のHTTPセッションを使わせる
+
+    クライアント自身がrequests.Sessionをsession属性に持っている場合のみ、そのクライアントのセッションを置き換える
+    (モジュールのrequestsなど、他のクライアントにも影響するものは置き換えない)。
+
+    Args:
+        client: APIクライアント
+        session (requests.Session): HTTPセッション
+
+    Returns:
+        bool: 共有のHTTPセッションを使わせられたかどうか
+    """
+    if isinstance(getattr(client, '__dict__', {}).get('session'), requests.Session):
+        client.session = session
+        return True
+    return False
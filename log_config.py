@@ -0,0 +1,66 @@
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import queue
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+
+# 起動中のQueueListener(setup_loggingを再度呼び出したときに停止する)
+_listener = None
+
+# ログの出力を設定する
+def setup_logging(level: str="WARNING", file_name: str="", use_queue: bool=True, debug_trace: bool=False) -> logging.Logger:
+    """アプリケーション全体のログの出力を設定する
+
+    ログの書式化と出力はuse_queueがTrueの場合、別スレッドのQueueListenerで行うため、
+    呼び出し元のスレッド(GUIや一括登録のスレッド)はキューに入れるだけで処理を続けられる。
+
+    Args:
+        level (str): 出力するログのレベル
+        file_name (str): 出力先のファイル(空の場合は標準エラー出力)
+        use_queue (bool): キューを経由して別スレッドで出力するかどうか
+        debug_trace (bool): 本の情報など詳細なデバッグログを出力するかどうか(levelより優先する)
+
+    Returns:
+        logging.Logger: 設定したルートロガー
+    """
+    global _listener
+    stop_logging()
+
+    if file_name:
+        handler = RotatingFileHandler(file_name, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.setLevel(logging.DEBUG if debug_trace else getattr(logging, level.upper(), logging.WARNING))
+
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        root.addHandler(QueueHandler(log_queue))
+        _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+    else:
+        root.addHandler(handler)
+    return root
+
+# 設定ファイルの値でログの出力を設定する
+def setup_logging_from_settings(settings) -> logging.Logger:
+    return setup_logging(
+        level=settings.get('Logging', 'level'),
+        file_name=settings.get('Logging', 'file_name'),
+        use_queue=settings.get('Logging', 'use_queue'),
+        debug_trace=settings.get('Logging', 'debug_trace'),
+    )
+
+# キューに残っているログを出力して停止する
+def stop_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
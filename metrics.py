@@ -0,0 +1,208 @@
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+
+# ヒストグラムのバケット(秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class NullTimer:
+    """計測が無効な場合に使う何もしないタイマー"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NULL_TIMER = NullTimer()
+
+class Timer:
+    def __init__(self, metrics: 'Metrics', name: str, labels: dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+class Metrics:
+    def __init__(self, enabled: bool=False, buckets: tuple=DEFAULT_BUCKETS):
+        """処理時間のヒストグラムとカウンタを集計する
+
+        無効な場合はtimer()が何もしないタイマーを返すため、計測の負荷はほとんどかからない。
+
+        Args:
+            enabled (bool): 計測するかどうか
+            buckets (tuple): ヒストグラムのバケット(秒)
+        """
+        self.enabled = enabled
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    # 処理時間を計測する
+    def timer(self, name: str, **labels):
+        """with文で囲んだ処理の時間を計測する
+
+        Args:
+            name (str): 計測項目名
+            **labels: ラベル
+
+        Returns:
+            タイマー
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name, labels)
+
+    # 処理時間を記録する
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = {"count": 0, "sum": 0.0, "min": seconds, "max": seconds, "buckets": [0] * len(self.buckets)}
+                self.histograms[key] = histogram
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            histogram["min"] = min(histogram["min"], seconds)
+            histogram["max"] = max(histogram["max"], seconds)
+            for index, bucket in enumerate(self.buckets):
+                if seconds <= bucket:
+                    histogram["buckets"][index] += 1
+                    break
+
+    # カウンタを加算する
+    def increment(self, name: str, value: int=1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # 集計結果を削除する
+    def reset(self) -> None:
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    # 集計結果を取得する
+    def snapshot(self) -> dict:
+        """集計結果を取得する
+
+        Returns:
+            dict: ヒストグラム(回数、合計、平均、最小、最大、p50/p99の推定値、バケットごとの累積回数)とカウンタ
+        """
+        with self.lock:
+            histograms = [(key, dict(histogram, buckets=list(histogram["buckets"]))) for key, histogram in self.histograms.items()]
+            counters = list(self.counters.items())
+        result = {"enabled": self.enabled, "histograms": [], "counters": []}
+        for (name, labels), histogram in sorted(histograms):
+            cumulative = []
+            total = 0
+            for count in histogram["buckets"]:
+                total += count
+                cumulative.append(total)
+            result["histograms"].append({
+                "name": name,
+                "labels": dict(labels),
+                "count": histogram["count"],
+                "sum": histogram["sum"],
+                "mean": histogram["sum"] / histogram["count"],
+                "min": histogram["min"],
+                "max": histogram["max"],
+                "p50": self.estimate_quantile(cumulative, histogram["count"], 0.50, histogram["max"]),
+                "p99": self.estimate_quantile(cumulative, histogram["count"], 0.99, histogram["max"]),
+                "buckets": {str(bucket): count for bucket, count in zip(self.buckets, cumulative)},
+            })
+        for (name, labels), value in sorted(counters):
+            result["counters"].append({"name": name, "labels": dict(labels), "value": value})
+        return result
+
+    def estimate_quantile(self, cumulative: list[int], count: int, quantile: float, maximum: float) -> float:
+        """バケットの上限からパーセンタイルを推定する"""
+        target = count * quantile
+        for bucket, total in zip(self.buckets, cumulative):
+            if total >= target:
+                return min(bucket, maximum)
+        return maximum
+
+    # JSON形式で出力する
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    # Prometheusのテキスト形式で出力する
+    def to_prometheus(self, prefix: str="easybookmanager") -> str:
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for histogram in snapshot["histograms"]:
+            name = f"{prefix}_{histogram['name']}_seconds"
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bucket, count in histogram["buckets"].items():
+                lines.append(f"{name}_bucket{format_labels(histogram['labels'], le=bucket)} {count}")
+            lines.append(f"{name}_bucket{format_labels(histogram['labels'], le='+Inf')} {histogram['count']}")
+            lines.append(f"{name}_sum{format_labels(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{format_labels(histogram['labels'])} {histogram['count']}")
+        for counter in snapshot["counters"]:
+            name = f"{prefix}_{counter['name']}_total"
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{format_labels(counter['labels'])} {counter['value']}")
+        return "\n".join(lines) + "\n"
+
+    # ファイルに出力する
+    def dump(self, path: str) -> None:
+        """集計結果をファイルに出力する(拡張子が.promの場合はPrometheusのテキスト形式、それ以外はJSON)
+
+        Args:
+            path (str): 出力先
+        """
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix=".metrics_", suffix=".tmp", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+
+def format_labels(labels: dict, **extra) -> str:
+    labels = dict(labels, **extra)
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+# アプリケーション全体で共有する集計
+METRICS = Metrics()
+
+# 関数の処理時間を計測するデコレータ
+def timed(name: str):
+    """関数の処理時間を計測するデコレータ
+
+    Args:
+        name (str): 計測項目名
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                METRICS.observe(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
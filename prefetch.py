@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from logging import getLogger
+import threading
+import time
+
+from book_search_api import calc_both_isbn
+
+from batch_import import iter_isbn_lines
+from utils import Database, RateLimiter
+
+class IsbnPrefetcher:
+    def __init__(self, db: Database, rate: float=None, max_workers: int=None):
+        """ISBNの一覧から本の情報を事前に検索し、読み取り時にすぐ使えるよう保存しておく
+
+        Args:
+            db (Database): データベース
+            rate (float): 1秒あたりに検索を開始するISBNの数(省略時は設定ファイルの値、0以下の場合は制限なし)
+            max_workers (int): 同時に検索するISBNの数(省略時は設定ファイルの値)
+        """
+        self.logger = getLogger(__name__)
+        self.db = db
+        self.rate_limiter = RateLimiter(rate if rate is not None else db.settings.get('Prefetch', 'rate'))
+        self.max_workers = max_workers or db.settings.get('Prefetch', 'max_workers')
+        self.cancelled = threading.Event()
+        self.thread = None
+
+    # 別スレッドで事前取得を開始する
+    def start(self, isbns, progress_callback=None) -> threading.Thread:
+        """別スレッドで事前取得を開始する
+
+        Args:
+            isbns (Iterable[str]): ISBN
+            progress_callback (callable): 進捗(dict)を受け取る関数(事前取得のスレッドから呼び出される)
+
+        Returns:
+            threading.Thread: 事前取得のスレッド
+        """
+        self.thread = threading.Thread(target=self.run, args=(isbns, progress_callback), name="prefetch", daemon=True)
+        self.thread.start()
+        return self.thread
+
+    # 事前取得を中止する
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    # 事前取得を行う
+    def run(self, isbns, progress_callback=None) -> dict:
+        """ISBNの一覧の本の情報を検索して保存する
+
+        Args:
+            isbns (Iterable[str]): ISBN
+            progress_callback (callable): 進捗(dict)を受け取る関数
+
+        Returns:
+            dict: 処理結果の件数と処理速度
+        """
+        self.logger.info("Prefetch start")
+        self.start_time = time.perf_counter()
+        self.stats = {
+            "processed": 0,     # 処理済み
+            "found": 0,         # 情報が見つかった
+            "not_found": 0,     # 情報が見つからなかった
+            "prefetched": 0,    # 既に事前取得済みだった
+            "exists": 0,        # 既に登録されていた
+            "duplicated": 0,    # 一覧内で重複していた
+            "invalid": 0,       # ISBNが正しくない
+            "failed": 0,        # 検索に失敗した
+            "skipped": 0,       # 中止したため検索しなかった
+        }
+        self.progress_callback = progress_callback
+        seen = set()
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="prefetch") as executor:
+            for isbn in isbns:
+                if self.cancelled.is_set():
+                    break
+                try:
+                    isbn_10, isbn_13 = calc_both_isbn(isbn)
+                except ValueError:
+                    self.count("invalid")
+                    continue
+                if isbn_13 in seen:
+                    self.count("duplicated")
+                    continue
+                seen.add(isbn_13)
+                # 一度に多くのAPIへ問い合わせないよう、検索を開始する間隔を空ける
+                self.rate_limiter.acquire()
+                pending.add(executor.submit(self.prefetch, isbn_13))
+                if len(pending) >= self.max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self.collect(done)
+            self.collect(pending)
+        result = self.progress()
+        result["cancelled"] = self.cancelled.is_set()
+        self.logger.info("Prefetch finished: %s", result)
+        return result
+
+    # 1件のISBNの情報を検索して保存する
+    def prefetch(self, isbn_13: str) -> str:
+        """1件のISBNの情報を検索して保存する
+
+        Args:
+            isbn_13 (str): ISBN13
+
+        Returns:
+            str: 結果の種類("found", "not_found", "prefetched", "exists", "skipped")
+        """
+        if self.cancelled.is_set():
+            return "skipped"
+        # 見つからなかった結果はAPIの障害によることもあるため、もう一度検索する
+        hit, book_info = self.db.get_prefetched_book_info(isbn_13)
+        if hit and book_info is not None:
+            return "prefetched"
+        if self.db.check_book_exist(isbn_13):
+            return "exists"
+        # APIへの問い合わせ中はデータベースの接続を持たない
+        start = time.perf_counter()
+        book_info = self.db.isbn_search_book(isbn_13, check_exists=False)
+        self.db.store_prefetched_book_info(isbn_13, book_info, time.perf_counter() - start)
+        return "found" if book_info is not None else "not_found"
+
+    # 検索が終わった結果を集計する
+    def collect(self, futures) -> None:
+        for future in futures:
+            try:
+                status = future.result()
+            except Exception:
+                self.logger.exception("Failed to prefetch ISBN")
+                status = "failed"
+            self.count(status)
+
+    def count(self, status: str) -> None:
+        self.stats[status] += 1
+        self.stats["processed"] += 1
+        if self.progress_callback is not None:
+            self.progress_callback(self.progress())
+
+    # 進捗を取得する
+    def progress(self) -> dict:
+        elapsed = time.perf_counter() - self.start_time
+        progress = dict(self.stats)
+        progress["elapsed"] = elapsed
+        progress["isbn_per_second"] = self.stats["processed"] / elapsed if elapsed > 0 else 0.0
+        return progress
+
+# テキスト(クリップボードなど)からISBNを取り出す
+def parse_isbn_text(text: str) -> list[str]:
+    # 表計算ソフトからコピーした場合はタブ区切りになるため、1列目を取り出せるようカンマに置き換える
+    return list(iter_isbn_lines(text.replace('\t', ',').splitlines()))
@@ -0,0 +1,205 @@
+from logging import getLogger
+import json
+import os
+import tempfile
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 指数移動平均の重み
+EWMA_ALPHA = 0.2
+
+class ProviderHealth:
+    def __init__(self, stats_path: str, failure_threshold: int, open_seconds: float, error_rate_threshold: float, slow_latency: float, adaptive_order: bool):
+        """APIごとの応答時間・エラー率・項目の充足率を記録し、サーキットブレーカーで障害中のAPIを飛ばす
+
+        Args:
+            stats_path (str): 統計情報の保存先
+            failure_threshold (int): サーキットを開く連続失敗回数
+            open_seconds (float): サーキットを開いてから再度試すまでの時間(秒)
+            error_rate_threshold (float): 後回しにするエラー率
+            slow_latency (float): 後回しにする平均応答時間(秒)
+            adaptive_order (bool): 調子の悪いAPIを後回しにするかどうか
+        """
+        self.logger = getLogger(__name__)
+        self.stats_path = stats_path
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_latency = slow_latency
+        self.adaptive_order = adaptive_order
+        self.lock = threading.Lock()
+        # 保存中に別のスレッドが同じファイルへ書き込まないようにする
+        self.save_lock = threading.Lock()
+        self.stats = {}
+        # 半開状態で試しに問い合わせているAPIと、その開始時刻(保存はしない)
+        self.probing = {}
+        self.last_saved = 0.0
+        # 保存は記録の度ではなく一定間隔ごとに行う
+        self.save_interval = 10.0
+        self.load()
+
+    def get(self, api_name: str) -> dict:
+        if api_name not in self.stats:
+            self.stats[api_name] = {
+                "requests": 0,
+                "errors": 0,
+                "latency": 0.0,             # 平均応答時間(秒、指数移動平均)
+                "error_rate": 0.0,          # エラー率(指数移動平均)
+                "completeness": 0.0,        # 項目の充足率(指数移動平均)
+                "consecutive_failures": 0,
+                "state": CLOSED,
+                "opened_at": 0.0,
+            }
+        return self.stats[api_name]
+
+    # APIに問い合わせてよいか確認する
+    def allow(self, api_name: str) -> bool:
+        """APIに問い合わせてよいか確認する
+
+        サーキットが開いている間はFalseを返し、一定時間が経過したら半開状態にして試しに問い合わせる。
+        半開状態で問い合わせるのは1件だけで、その結果が記録されるまで他の呼び出しにはFalseを返す
+        (結果が記録されないまま open_seconds が経過した場合は、もう1件試す)。
+
+        Args:
+            api_name (str): API名
+
+        Returns:
+            bool: 問い合わせてよいかどうか
+        """
+        with self.lock:
+            stats = self.get(api_name)
+            if stats["state"] == OPEN:
+                if time.time() - stats["opened_at"] < self.open_seconds:
+                    return False
+                self.logger.info("Circuit half-open: api=%s", api_name)
+                stats["state"] = HALF_OPEN
+            if stats["state"] == HALF_OPEN:
+                now = time.monotonic()
+                if api_name in self.probing and now - self.probing[api_name] < self.open_seconds:
+                    return False
+                self.probing[api_name] = now
+            return True
+
+    # 問い合わせの成功を記録する
+    def record_success(self, api_name: str, latency: float, completeness: float) -> None:
+        """問い合わせの成功を記録する(見つからなかった場合も成功として扱う)
+
+        Args:
+            api_name (str): API名
+            latency (float): 応答時間(秒)
+            completeness (float): 項目の充足率(0〜1)
+        """
+        with self.lock:
+            stats = self.get(api_name)
+            self.probing.pop(api_name, None)
+            self.update(stats, latency, 0.0)
+            stats["completeness"] += EWMA_ALPHA * (completeness - stats["completeness"])
+            stats["consecutive_failures"] = 0
+            if stats["state"] != CLOSED:
+                self.logger.info("Circuit closed: api=%s", api_name)
+                stats["state"] = CLOSED
+                self.last_saved = 0.0
+        self.save_if_needed()
+
+    # 問い合わせの失敗を記録する
+    def record_failure(self, api_name: str, latency: float) -> None:
+        """問い合わせの失敗(通信エラーやタイムアウト)を記録する
+
+        Args:
+            api_name (str): API名
+            latency (float): 失敗するまでの時間(秒)
+        """
+        with self.lock:
+            stats = self.get(api_name)
+            self.probing.pop(api_name, None)
+            self.update(stats, latency, 1.0)
+            stats["errors"] += 1
+            stats["consecutive_failures"] += 1
+            if stats["state"] == HALF_OPEN or (stats["state"] == CLOSED and stats["consecutive_failures"] >= self.failure_threshold):
+                self.logger.warning("Circuit opened: api=%s, consecutive_failures=%s", api_name, stats['consecutive_failures'])
+                stats["state"] = OPEN
+                stats["opened_at"] = time.time()
+                self.last_saved = 0.0
+        self.save_if_needed()
+
+    def update(self, stats: dict, latency: float, error: float) -> None:
+        if stats["requests"] == 0:
+            stats["latency"] = latency
+            stats["error_rate"] = error
+        else:
+            stats["latency"] += EWMA_ALPHA * (latency - stats["latency"])
+            stats["error_rate"] += EWMA_ALPHA * (error - stats["error_rate"])
+        stats["requests"] += 1
+
+    # 問い合わせる順番を決める
+    def order(self, api_names: list[str]) -> list[str]:
+        """問い合わせる順番を決める
+
+        エラー率が高いAPIや応答が遅いAPIは、設定された順番を保ったまま後ろへ回す。
+
+        Args:
+            api_names (list[str]): 設定された順番に並んだAPI名
+
+        Returns:
+            list[str]: 問い合わせる順番に並んだAPI名
+        """
+        if not self.adaptive_order:
+            return api_names
+        with self.lock:
+            degraded = {api_name for api_name in api_names if self.is_degraded(self.get(api_name))}
+        return [api_name for api_name in api_names if api_name not in degraded] + [api_name for api_name in api_names if api_name in degraded]
+
+    def is_degraded(self, stats: dict) -> bool:
+        return stats["state"] != CLOSED or stats["error_rate"] >= self.error_rate_threshold or stats["latency"] >= self.slow_latency
+
+    # 統計情報を取得する
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {api_name: dict(stats) for api_name, stats in self.stats.items()}
+
+    # 統計情報を読み込む
+    def load(self) -> None:
+        if not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            self.logger.exception("Failed to load provider health: %s", self.stats_path)
+            return
+        for api_name, values in stats.items():
+            self.get(api_name).update(values)
+
+    # 統計情報を保存する
+    def save(self) -> None:
+        """統計情報を保存する
+
+        一時ファイルに書き込んでから置き換えるため、書き込み途中のファイルが読まれることはない。
+        """
+        with self.save_lock:
+            snapshot = self.snapshot()
+            directory = os.path.dirname(os.path.abspath(self.stats_path))
+            try:
+                fd, temp_path = tempfile.mkstemp(prefix=".provider_health_", suffix=".tmp", dir=directory)
+            except OSError:
+                self.logger.exception("Failed to save provider health: %s", self.stats_path)
+                return
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f, ensure_ascii=False, indent=2)
+                os.replace(temp_path, self.stats_path)
+            except OSError:
+                self.logger.exception("Failed to save provider health: %s", self.stats_path)
+                os.remove(temp_path)
+
+    def save_if_needed(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_saved < self.save_interval:
+                return
+            self.last_saved = now
+        self.save()
@@ -0,0 +1,352 @@
+"""
+EasyBookManagerのHTTP/JSON APIサーバー(複数の端末から1つのdb.sqlite3を共有する)
+
+使い方:
+    pip install uvicorn
+    python server.py --host 127.0.0.1 --port 8000
+
+エンドポイント:
+    GET    /books?title=&author=&publisher=&subject=&place=&remarks=&limit=&offset=   本の検索
+    GET    /books/{isbn}                                                               1冊の取得
+    POST   /books                                                                      本の登録(JSON)
+    PUT    /books/{isbn}                                                               本の情報の更新(JSON)
+    DELETE /books/{isbn}                                                               本の削除
+    GET    /lookup/{isbn}                                                              ISBNからインターネット上の情報を検索
+    GET    /export?format=csv|jsonl                                                    全件の書き出し(ストリーミング)
+    GET    /stats                                                                      登録件数と統計情報
+    GET    /metrics                                                                    処理時間の計測結果(Prometheus形式)
+
+アプリケーション本体はフレームワークに依存しないASGIアプリケーションで、uvicornなど任意のASGIサーバーで動かせる。
+データベースの処理はスレッドプールで実行するため、イベントループは止まらない。既定のストレージのプロファイル
+(default、ロールバックジャーナル)では書き込み中の検索は待たされるため、同時に使う端末が多い場合は
+config.iniの[Database] storage_profileをbalanced(WAL)にすると、書き込み中も検索を並行して行える。
+書き込みは開始時に書き込みロックを取り、ロックを待ちきれなかった場合は503(Retry-After付き)を返す。
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import io
+import json
+from logging import getLogger
+from urllib.parse import parse_qsl, unquote
+
+from book_search_api import calc_both_isbn
+import sqlalchemy.exc
+
+from utils import Database, BOOK_INFO_COLUMNS, DOWNLOAD_COLUMNS
+
+SEARCH_PARAMETERS = ('isbn', 'title', 'author', 'publisher', 'subject', 'number', 'remarks', 'place')
+UPDATE_FIELDS = ('title', 'author', 'publisher', 'subject', 'number', 'remarks', 'place')
+# データベースのロックを待ちきれなかった場合に、再試行するまでの秒数
+RETRY_AFTER_SECONDS = 1
+
+# データベースのロックを待ちきれなかったエラーかどうか
+def is_database_locked(error: Exception) -> bool:
+    return isinstance(error, sqlalchemy.exc.OperationalError) and 'locked' in str(error.orig)
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class BookServer:
+    def __init__(self, db: Database=None, max_workers: int=None):
+        """DatabaseをHTTP/JSONで公開するASGIアプリケーション
+
+        Args:
+            db (Database): データベース(省略時は作成する)
+            max_workers (int): データベースの処理を行うスレッド数(省略時は設定ファイルの値)
+        """
+        self.logger = getLogger("uvicorn.app")
+        self.db = db or Database()
+        self.max_workers = max_workers or self.db.settings.get('Server', 'max_workers')
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="server")
+        self.routes = [
+            ('GET', ('books',), self.search_books),
+            ('POST', ('books',), self.register_book),
+            ('GET', ('books', None), self.get_book),
+            ('PUT', ('books', None), self.update_book),
+            ('DELETE', ('books', None), self.delete_book),
+            ('GET', ('lookup', None), self.lookup_book),
+            ('GET', ('export',), self.export_books),
+            ('GET', ('stats',), self.stats),
+            ('GET', ('metrics',), self.metrics),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        # 応答の送信を始めた後はエラーの応答を送れないため、始めたかどうかを記録する
+        started = False
+
+        async def tracked_send(message):
+            nonlocal started
+            if message['type'] == 'http.response.start':
+                started = True
+            await send(message)
+
+        try:
+            handler, path_args = self.route(scope['method'], scope['path'])
+            query = dict(parse_qsl(scope.get('query_string', b'').decode('utf-8')))
+            await handler(scope, receive, tracked_send, query, *path_args)
+        except HTTPError as e:
+            if started:
+                raise
+            await self.send_json(send, {'error': e.message}, status=e.status)
+        except Exception as e:
+            if is_database_locked(e) and not started:
+                self.logger.warning("Database is locked: %s %s", scope['method'], scope['path'])
+                await self.send_json(send, {'error': 'database is busy, retry later'}, status=503, headers=[(b'retry-after', str(RETRY_AFTER_SECONDS).encode('ascii'))])
+                return
+            self.logger.exception("Request failed: %s %s", scope['method'], scope['path'])
+            if started:
+                # 送信途中の応答は完了させず、例外をサーバーに返して接続を切らせる
+                raise
+            await self.send_json(send, {'error': 'internal server error'}, status=500)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        if self.db.provider_health is not None:
+            self.db.provider_health.save()
+
+    # パスから処理を選ぶ
+    def route(self, method: str, path: str):
+        parts = tuple(unquote(part) for part in path.strip('/').split('/') if part)
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            if len(pattern) != len(parts) or any(expected is not None and expected != part for expected, part in zip(pattern, parts)):
+                continue
+            if route_method == method:
+                return handler, [part for expected, part in zip(pattern, parts) if expected is None]
+            allowed = True
+        if allowed:
+            raise HTTPError(405, 'method not allowed')
+        raise HTTPError(404, 'not found')
+
+    # データベースの処理をスレッドプールで実行する
+    async def run(self, function, *args, executor=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor or self.executor, lambda: function(*args, **kwargs))
+
+    # 書き込みを作業単位の中でスレッドプールで実行する
+    async def run_write(self, function, *args, **kwargs):
+        """開始時に書き込みロックを取るため、ロックを待ちきれなかった場合は例外になり503を返す"""
+        def write():
+            with self.db.unit_of_work():
+                return function(*args, **kwargs)
+        return await self.run(write)
+
+    async def read_json(self, receive) -> dict:
+        body = bytearray()
+        while True:
+            message = await receive()
+            body.extend(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        try:
+            data = json.loads(body or b'{}')
+        except ValueError:
+            raise HTTPError(400, 'invalid JSON')
+        if not isinstance(data, dict):
+            raise HTTPError(400, 'JSON object expected')
+        return data
+
+    async def send_json(self, send, data, status: int=200, headers: list=None) -> None:
+        await self.send_body(send, json.dumps(data, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8', status, headers)
+
+    async def send_body(self, send, body: bytes, content_type: str, status: int=200, headers: list=None) -> None:
+        headers = [(b'content-type', content_type.encode('ascii')), (b'content-length', str(len(body)).encode('ascii'))] + (headers or [])
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def parse_isbn(self, isbn: str) -> tuple[str, str]:
+        try:
+            return calc_both_isbn(isbn)
+        except ValueError:
+            raise HTTPError(400, f'invalid ISBN: {isbn}')
+
+    def parse_int(self, query: dict, name: str, default):
+        if name not in query:
+            return default
+        try:
+            return int(query[name])
+        except ValueError:
+            raise HTTPError(400, f'invalid {name}: {query[name]}')
+
+    # GET /books
+    async def search_books(self, scope, receive, send, query):
+        filters = {name: query.get(name, '') for name in SEARCH_PARAMETERS}
+        if filters['isbn']:
+            self.parse_isbn(filters['isbn'])
+        limit = self.parse_int(query, 'limit', None)
+        offset = self.parse_int(query, 'offset', 0)
+        rows = await self.run(self.db.search_book_rows, **filters, limit=limit, offset=offset)
+        await self.send_json(send, [row._asdict() for row in rows])
+
+    # GET /books/{isbn}
+    async def get_book(self, scope, receive, send, query, isbn):
+        isbn_10, isbn_13 = self.parse_isbn(isbn)
+        rows = await self.run(self.db.search_book_rows, isbn=isbn_10)
+        if len(rows) == 0:
+            raise HTTPError(404, 'book not found')
+        await self.send_json(send, rows[0]._asdict())
+
+    # POST /books
+    async def register_book(self, scope, receive, send, query):
+        data = await self.read_json(receive)
+        isbn_10, isbn_13 = self.parse_isbn(str(data.get('isbn_13') or data.get('isbn_10') or data.get('isbn') or ''))
+        book_data = {column: str(data.get(column) or '') for column in BOOK_INFO_COLUMNS}
+        book_data['isbn_10'], book_data['isbn_13'] = isbn_10, isbn_13
+        if not await self.run_write(self.db.register_book, book_data):
+            raise HTTPError(409, 'book already exists or could not be registered')
+        await self.send_json(send, book_data, status=201)
+
+    # PUT /books/{isbn}
+    async def update_book(self, scope, receive, send, query, isbn):
+        isbn_10, isbn_13 = self.parse_isbn(isbn)
+        data = await self.read_json(receive)
+
+        def update():
+            # 指定されなかった項目は今の値のままにする(読み込みから書き込みまで書き込みロックを持ったまま行う)
+            rows = self.db.search_book_rows(isbn=isbn_10)
+            if len(rows) == 0:
+                return None
+            book = rows[0]._asdict()
+            book.update({field: '' if data[field] is None else str(data[field]) for field in UPDATE_FIELDS if field in data})
+            if not self.db.update_book(**{column: book[column] for column in BOOK_INFO_COLUMNS}):
+                return None
+            return book
+
+        book = await self.run_write(update)
+        if book is None:
+            raise HTTPError(404, 'book not found')
+        await self.send_json(send, book)
+
+    # DELETE /books/{isbn}
+    async def delete_book(self, scope, receive, send, query, isbn):
+        isbn_10, isbn_13 = self.parse_isbn(isbn)
+        if not await self.run_write(self.db.delete_book, isbn_10):
+            raise HTTPError(404, 'book not found')
+        await self.send_json(send, {'isbn_10': isbn_10, 'isbn_13': isbn_13, 'deleted': True})
+
+    # GET /lookup/{isbn}
+    async def lookup_book(self, scope, receive, send, query, isbn):
+        isbn_10, isbn_13 = self.parse_isbn(isbn)
+
+        def lookup():
+            if self.db.check_book_exist(isbn_13):
+                return 'exists', None
+            # APIへの問い合わせ中はデータベースの接続を持たない
+            return 'resolved', self.db.isbn_search_book(isbn_13, check_exists=False)
+
+        status, book_info = await self.run(lookup)
+        if status == 'exists':
+            raise HTTPError(409, 'book already exists')
+        if book_info is None:
+            raise HTTPError(404, 'book information not found')
+        await self.send_json(send, book_info)
+
+    # GET /export
+    async def export_books(self, scope, receive, send, query):
+        output_format = query.get('format', 'csv')
+        if output_format not in ('csv', 'jsonl'):
+            raise HTTPError(400, f'invalid format: {output_format}')
+        batch_size = self.parse_int(query, 'batch_size', 1000)
+        rows = self.db.iter_download_data(batch_size)
+        columns = list(DOWNLOAD_COLUMNS.values())
+
+        def next_chunk():
+            # batch_size件ずつ文字列にしてから送る
+            buffer = io.StringIO()
+            writer = csv.writer(buffer) if output_format == 'csv' else None
+            for count, row in enumerate(rows, 1):
+                if writer is not None:
+                    writer.writerow(row)
+                else:
+                    buffer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                    buffer.write('\n')
+                if count >= batch_size:
+                    break
+            return buffer.getvalue().encode('utf-8')
+
+        content_type = 'text/csv; charset=utf-8' if output_format == 'csv' else 'application/x-ndjson; charset=utf-8'
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', content_type.encode('ascii'))]})
+        # SQLiteの接続は作成したスレッドで使う必要があるため、書き出しは専用のスレッドで行う
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+        try:
+            if output_format == 'csv':
+                header = io.StringIO()
+                csv.writer(header).writerow(DOWNLOAD_COLUMNS)
+                await send({'type': 'http.response.body', 'body': header.getvalue().encode('utf-8'), 'more_body': True})
+            while True:
+                chunk = await self.run(next_chunk, executor=executor)
+                if not chunk:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await self.run(rows.close, executor=executor)
+            executor.shutdown(wait=False)
+
+    # GET /stats
+    async def stats(self, scope, receive, send, query):
+        def collect():
+            return {
+                'books': self.db.count_books(),
+                'storage_profile': self.db.storage_profile,
+                'search_cache': self.db.get_search_cache_stats(),
+                'isbn_search_flight': self.db.get_isbn_search_flight_stats(),
+                'provider_health': self.db.get_provider_health(),
+            }
+
+        await self.send_json(send, await self.run(collect))
+
+    # GET /metrics
+    async def metrics(self, scope, receive, send, query):
+        await self.send_body(send, self.db.metrics.to_prometheus().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8')
+
+# uvicornなどから読み込むアプリケーションを作成する
+def create_app(db: Database=None, max_workers: int=None) -> BookServer:
+    return BookServer(db, max_workers)
+
+def main():
+    parser = argparse.ArgumentParser(description='EasyBookManagerのHTTP/JSON APIサーバー')
+    parser.add_argument('--host', default=None, help='待ち受けるアドレス(省略時は設定ファイルの値)')
+    parser.add_argument('--port', type=int, default=None, help='待ち受けるポート(省略時は設定ファイルの値)')
+    parser.add_argument('--workers', type=int, default=None, help='データベースの処理を行うスレッド数(省略時は設定ファイルの値)')
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit('サーバーモードにはuvicornが必要です: pip install uvicorn')
+
+    from log_config import setup_logging_from_settings
+
+    app = create_app(max_workers=args.workers)
+    setup_logging_from_settings(app.db.settings)
+    uvicorn.run(
+        app,
+        host=args.host or app.db.settings.get('Server', 'host'),
+        port=args.port or app.db.settings.get('Server', 'port'),
+        log_config=None,
+    )
+
+if __name__ == '__main__':
+    main()
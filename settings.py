@@ -0,0 +1,168 @@
+from configparser import ConfigParser
+from contextlib import contextmanager
+from logging import getLogger
+import os
+import tempfile
+import threading
+import time
+
+class Settings:
+    def __init__(self, config_path: str, defaults: dict):
+        """設定ファイルを一度だけ読み込み、型を変換した値をメモリ上に保持する
+
+        値の型はデフォルト値の型(bool, int, float, str, list)に合わせる。
+        設定ファイルの更新日時が変わった場合のみ読み込み直す。
+
+        Args:
+            config_path (str): 設定ファイルのパス
+            defaults (dict): セクションごとのデフォルト値
+        """
+        self.logger = getLogger(__name__)
+        self.config_path = config_path
+        self.defaults = defaults
+        self.config = ConfigParser()
+        self.values = {}
+        self.lock = threading.RLock()
+        self.mtime = None
+        # 更新日時の確認は一定間隔ごとに行う
+        self.check_interval = 1.0
+        self.last_checked = 0.0
+        self.batch_depth = 0
+        self.dirty = False
+        self.load()
+
+    # 設定ファイルを読み込む
+    def load(self) -> None:
+        """設定ファイルを読み込み、不足している項目はデフォルト値で補完する"""
+        with self.lock:
+            config = ConfigParser()
+            config.read(self.config_path, encoding="utf-8")
+            missing = False
+            for section, values in self.defaults.items():
+                if not config.has_section(section):
+                    config[section] = {}
+                for key, value in values.items():
+                    if key not in config[section]:
+                        config[section][key] = self.format(value)
+                        missing = True
+            self.config = config
+            self.values = {section: {key: self.parse(section, key, value) for key, value in config[section].items()} for section in config.sections()}
+            self.mtime = self.get_mtime()
+            self.last_checked = time.monotonic()
+            if missing:
+                self.logger.info("Writing default config: %s", self.config_path)
+                self.dirty = True
+                self.flush()
+
+    # 設定ファイルが変更されていれば読み込み直す
+    def reload_if_changed(self) -> None:
+        now = time.monotonic()
+        if now - self.last_checked < self.check_interval:
+            return
+        self.last_checked = now
+        if self.get_mtime() != self.mtime:
+            self.logger.info("Config file changed, reloading: %s", self.config_path)
+            self.load()
+
+    # 型を変換した設定値を取得する
+    def get(self, section: str, key: str):
+        """型を変換した設定値を取得する
+
+        Args:
+            section (str): セクション名
+            key (str): キー名
+
+        Returns:
+            設定値
+        """
+        self.reload_if_changed()
+        return self.values[section][key]
+
+    # 文字列の設定値を取得する
+    def get_raw(self, section: str, key: str) -> str:
+        self.reload_if_changed()
+        return self.config[section][key]
+
+    # 設定値を変更する
+    def set(self, section: str, key: str, value) -> None:
+        """設定値を変更する
+
+        batch()の中で呼び出した場合は、抜けるときにまとめて書き込む。
+
+        Args:
+            section (str): セクション名
+            key (str): キー名
+            value: 設定値
+        """
+        with self.lock:
+            if not self.config.has_section(section):
+                self.config[section] = {}
+                self.values[section] = {}
+            raw = value if isinstance(value, str) else self.format(value)
+            self.config[section][key] = raw
+            self.values[section][key] = self.parse(section, key, raw)
+            self.dirty = True
+            if self.batch_depth == 0:
+                self.flush()
+
+    # 設定値の変更をまとめて書き込む
+    @contextmanager
+    def batch(self):
+        with self.lock:
+            self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.batch_depth -= 1
+                if self.batch_depth == 0:
+                    self.flush()
+
+    # 設定ファイルに書き込む
+    def flush(self) -> None:
+        """設定ファイルに書き込む
+
+        一時ファイルに書き込んでから置き換えるため、書き込み途中の設定ファイルが読まれることはない。
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            directory = os.path.dirname(os.path.abspath(self.config_path))
+            fd, temp_path = tempfile.mkstemp(prefix=".config_", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    self.config.write(f)
+                os.replace(temp_path, self.config_path)
+            except:
+                os.remove(temp_path)
+                raise
+            self.dirty = False
+            self.mtime = self.get_mtime()
+
+    def get_mtime(self) -> float:
+        try:
+            return os.stat(self.config_path).st_mtime
+        except OSError:
+            return None
+
+    def parse(self, section: str, key: str, value: str):
+        """デフォルト値の型に合わせて設定値を変換する(デフォルト値がない項目は文字列のまま)"""
+        default = self.defaults.get(section, {}).get(key)
+        try:
+            if isinstance(default, bool):
+                return ConfigParser.BOOLEAN_STATES.get(value.lower(), False)
+            if isinstance(default, int):
+                return int(value)
+            if isinstance(default, float):
+                return float(value)
+            if isinstance(default, (list, tuple)):
+                return [item.strip() for item in value.split(',') if len(item.strip()) > 0]
+        except ValueError:
+            self.logger.error("Invalid config value: section=%s, key=%s, value=%s", section, key, value)
+            return default
+        return value
+
+    def format(self, value) -> str:
+        if isinstance(value, (list, tuple)):
+            return ','.join(value)
+        return str(value)
@@ -0,0 +1,64 @@
+import threading
+
+class SingleFlightCall:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self):
+        """同じキーの処理が同時に呼び出された場合に、1回だけ実行して結果を共有する
+
+        結果は保存しないため、処理が終わった後の呼び出しは再度実行される(結果の保存はBookSearchCacheで行う)。
+        """
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0      # 実際に実行した回数
+        self.shared = 0        # 実行中の処理の結果を共有した回数
+
+    # 処理を実行する
+    def do(self, key, function, *args, **kwargs) -> tuple[object, bool]:
+        """同じキーの処理が実行中であれば終わるのを待って結果を共有し、なければ実行する
+
+        Args:
+            key: キー
+            function (callable): 処理
+
+        Returns:
+            tuple[object, bool]: 処理の結果と、実行中の処理の結果を共有したかどうか
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = SingleFlightCall()
+                self.calls[key] = call
+                self.executed += 1
+                leader = True
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result, False
+
+    # 統計情報を取得する
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "executed": self.executed,
+                "shared": self.shared,
+                "in_flight": len(self.calls),
+            }
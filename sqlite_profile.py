@@ -0,0 +1,176 @@
+from logging import getLogger
+import os
+import sys
+
+from sqlalchemy import event
+
+logger = getLogger(__name__)
+
+# 接続ごとに設定するPRAGMAの組み合わせ
+STORAGE_PROFILES = {
+    # SQLiteの既定値のまま(ロールバックジャーナル、synchronous=FULL)
+    "default": {},
+    # 書き込み中も読み込みを止めないWALで、コミットごとのfsyncを省く(電源断時に直前のコミットが失われることはあるが壊れはしない)
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,           # 64MiB(負の値はKiB単位)
+        "mmap_size": 268435456,         # 256MiB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # WALを使いつつ、コミットごとにfsyncする
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16384,           # 16MiB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # 一括登録などで速度を優先する(fsyncしないため、OSの異常終了時にデータベースが壊れる可能性がある)
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -262144,          # 256MiB
+        "mmap_size": 1073741824,        # 1GiB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+# WALを使えないネットワークファイルシステム(/proc/mountsの種類)
+NETWORK_FILESYSTEMS = {
+    "nfs", "nfs4", "cifs", "smbfs", "smb3", "afs", "9p", "ceph", "glusterfs",
+    "fuse.sshfs", "fuse.davfs2", "fuse.glusterfs", "fuse.cephfs",
+}
+
+# 設定するPRAGMAを決める
+def resolve_pragmas(profile: str, overrides: str="") -> dict:
+    """プロファイルと個別の設定から、接続ごとに設定するPRAGMAを決める
+
+    Args:
+        profile (str): プロファイル名(STORAGE_PROFILESのキー)
+        overrides (str): "名前=値"をカンマ区切りで並べた個別の設定(プロファイルの値より優先する)
+
+    Returns:
+        dict: PRAGMAの名前と値
+    """
+    if profile not in STORAGE_PROFILES:
+        logger.error("Unknown storage profile: %s", profile)
+        profile = "default"
+    pragmas = dict(STORAGE_PROFILES[profile])
+    for item in overrides.split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            pragmas[name.strip().lower()] = value.strip()
+    return pragmas
+
+# ネットワーク上のパスかどうか確認する
+def is_network_path(path: str) -> bool:
+    """ファイルがネットワーク共有(SMB・NFSなど)上にあるかどうかを確認する
+
+    判定できない環境(macOSなど)ではFalseを返す。
+
+    Args:
+        path (str): ファイルのパス
+
+    Returns:
+        bool: ネットワーク共有上にあるかどうか
+    """
+    path = os.path.abspath(path)
+    if sys.platform == "win32":
+        if path.startswith("\\\\"):
+            return True
+        import ctypes
+        # 4はDRIVE_REMOTE(ネットワークドライブ)
+        return ctypes.windll.kernel32.GetDriveTypeW(os.path.splitdrive(path)[0] + "\\") == 4
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8") as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) >= 3]
+    except OSError:
+        return False
+    # パスを含むマウントポイントのうち、最も長いものの種類で判定する
+    fs_type = None
+    mount_length = -1
+    for mount_point, mount_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > mount_length:
+            fs_type = mount_type
+            mount_length = len(mount_point)
+    return fs_type in NETWORK_FILESYSTEMS
+
+# ファイルの置き場所に合わせてPRAGMAを調整する
+def adjust_pragmas_for_path(pragmas: dict, path: str) -> dict:
+    """ネットワーク共有上のデータベースではWALとmmapを使わないようにする
+
+    WALは共有メモリを使うため、ネットワークファイルシステム上では正しく動かない。
+    以前WALで開いたファイルも元に戻せるよう、ジャーナルモードはDELETEを明示する。
+
+    Args:
+        pragmas (dict): PRAGMAの名前と値
+        path (str): データベースファイルのパス
+
+    Returns:
+        dict: 調整後のPRAGMAの名前と値
+    """
+    if not is_network_path(path):
+        return pragmas
+    pragmas = dict(pragmas)
+    if str(pragmas.get("journal_mode", "")).upper() == "WAL":
+        logger.warning("WAL is not available on a network filesystem, using rollback journal: %s", path)
+    pragmas["journal_mode"] = "DELETE"
+    pragmas.pop("mmap_size", None)
+    return pragmas
+
+# エンジンの接続時にPRAGMAを設定する
+def apply_pragmas(engine, pragmas: dict) -> None:
+    """エンジンが新しく接続するたびにPRAGMAを設定する
+
+    Args:
+        engine (sqlalchemy.engine.Engine): SQLiteのエンジン
+        pragmas (dict): PRAGMAの名前と値
+    """
+    if not pragmas:
+        return
+    statements = [f"PRAGMA {name}={value}" for name, value in pragmas.items()]
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+# 書き込み用の接続に指定する実行オプション(BEGIN IMMEDIATEでトランザクションを開始する)
+BEGIN_IMMEDIATE = "sqlite_begin_immediate"
+
+# SAVEPOINTを使えるようにする
+def enable_savepoints(engine) -> None:
+    """pysqlite独自のBEGINの発行を止め、トランザクションの開始をSQLAlchemyに任せる
+
+    pysqliteは最初の書き込みの直前までBEGINを発行しないため、その前にSAVEPOINTを発行すると
+    RELEASEの時点で外側のトランザクションごとコミットされてしまう(SQLAlchemyのドキュメントにある対処方法)。
+    実行オプションBEGIN_IMMEDIATEを指定した接続は、読み込みから書き込みへのロックの昇格で
+    他の書き込みと待ち合わせにならないよう、BEGIN IMMEDIATEで最初から書き込みロックを取る。
+
+    Args:
+        engine (sqlalchemy.engine.Engine): SQLiteのエンジン
+    """
+    @event.listens_for(engine, "connect")
+    def disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        if connection.get_execution_options().get(BEGIN_IMMEDIATE):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            connection.exec_driver_sql("BEGIN")
+
+# 現在の設定値を取得する
+def read_pragmas(engine, names) -> dict:
+    """接続に設定されているPRAGMAの値を取得する(ベンチマークや診断での確認用)"""
+    with engine.connect() as connection:
+        return {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in names}
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from book_search_api import calc_both_isbn
+from utils import Database
+
+ISBN_LIST = ['9784101010014', '9784003101018', '9784167158057', '9784062748681']
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # config.iniとデータベースは作業ディレクトリに作成される
+    monkeypatch.chdir(tmp_path)
+    db = Database()
+    yield db
+    db.engine.dispose()
+    if db.search_cache is not None:
+        db.search_cache.engine.dispose()
+
+def make_book(db, isbn, title='タイトル'):
+    isbn_10, isbn_13 = calc_both_isbn(isbn)
+    return db.merge_book_info(isbn_10, isbn_13, [{'title': title}])
+
+def get_title(db, isbn_13):
+    return db.search_book_rows(isbn=isbn_13)[0].title
+
+# 作業単位の中で失敗した処理があっても、それまでに成功した処理の変更はコミットされる
+def test_failed_write_keeps_earlier_writes_in_unit(db):
+    book = make_book(db, ISBN_LIST[0], '変更前')
+    assert db.register_book(book)
+
+    with db.unit_of_work():
+        assert db.update_book(**dict(book, title='変更後'))
+        # 登録済みのISBNのため、フラッシュの時点で失敗する
+        assert not db.register_book(book)
+        other = make_book(db, ISBN_LIST[1])
+        assert db.register_book(other)
+
+    assert get_title(db, ISBN_LIST[0]) == '変更後'
+    assert db.check_book_exist(ISBN_LIST[1])
+
+# 作業単位を例外で抜けた場合は全ての変更を取り消す
+def test_exception_rolls_back_whole_unit(db):
+    book = make_book(db, ISBN_LIST[0], '変更前')
+    assert db.register_book(book)
+
+    with pytest.raises(RuntimeError):
+        with db.unit_of_work():
+            assert db.update_book(**dict(book, title='変更後'))
+            raise RuntimeError()
+
+    assert get_title(db, ISBN_LIST[0]) == '変更前'
+
+# 複数のスレッドから同時に更新してもロックの昇格で失敗しない
+def test_concurrent_updates_do_not_fail(db):
+    books = [make_book(db, isbn_13) for isbn_13 in ISBN_LIST]
+    assert db.register_books(books)['registered'] == len(books)
+    failures = []
+
+    def update(worker):
+        for index in range(20):
+            book = books[(worker + index) % len(books)]
+            if not db.update_book(**dict(book, remarks=f'{worker}-{index}')):
+                failures.append(book['isbn_13'])
+
+    threads = [threading.Thread(target=update, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert failures == []
@@ -1,14 +1,27 @@
-from configparser import ConfigParser
-from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+import inspect
+import json
 from logging import getLogger
 import os
+import threading
+import time
+from typing import NamedTuple
 import unicodedata
-import traceback
 
 from book_search_api import OpenBDAPI, OpenLibraryAPI, GoogleBooksAPI, NDLAPI, calc_both_isbn
 import sqlalchemy
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, Column, String, DateTime, insert, select, or_, func
+from sqlalchemy.orm import sessionmaker, scoped_session, declarative_base
+
+from book_search_cache import BookSearchCache, MERGED_PROVIDER
+from http_session import attach_http_session, create_http_session, parse_host_overrides
+from provider_health import ProviderHealth
+from settings import Settings
+from single_flight import SingleFlight
+from sqlite_profile import BEGIN_IMMEDIATE, adjust_pragmas_for_path, apply_pragmas, enable_savepoints, resolve_pragmas
+from metrics import METRICS, timed
 
 DEFAULT_SEARCH_VALUE = {
     "isbn": "",
@@ -20,6 +33,98 @@ DEFAULT_SEARCH_VALUE = {
     "remarks": "",
 }
 
+# 設定ファイルのデフォルト値
+DEFAULT_CONFIG = {
+    "BookSearch": {
+        "search_timeout": 5.0,
+        "openbd": True,
+        "open_library": True,
+        "google_books": True,
+        "ndl": True,
+        "search_order": ["ndl", "open_library", "google_books", "openbd"],
+        "concurrent_search": True,
+        "max_workers": 8,
+    },
+    "BookSearchCache": {
+        "enabled": True,
+        "file_name": "book_search_cache.sqlite3",
+        "ttl": 604800.0,
+        "negative_ttl": 86400.0,
+        "max_entries": 100000,
+        # キャッシュは消えても再取得できるため、既定でWALを使う(ネットワーク共有上では使わない)
+        "storage_profile": "balanced",
+    },
+    # 各APIへの1秒あたりの最大リクエスト数(0の場合は制限なし)
+    "RateLimit": {
+        "openbd": 10.0,
+        "open_library": 5.0,
+        "google_books": 5.0,
+        "ndl": 5.0,
+    },
+    "BatchImport": {
+        "max_workers": 4,
+        "batch_size": 100,
+    },
+    "Database": {
+        "file_name": "db.sqlite3",
+        "storage_profile": "default",
+        "pragma_overrides": "",
+        "bulk_batch_size": 500,
+    },
+    "ProviderHealth": {
+        "enabled": True,
+        "file_name": "provider_health.json",
+        "failure_threshold": 3,
+        "open_seconds": 60.0,
+        "error_rate_threshold": 0.5,
+        "slow_latency": 3.0,
+        "adaptive_order": True,
+    },
+    "HTTP": {
+        "pool_maxsize": 4,
+        "host_overrides": "",
+    },
+    "Logging": {
+        "level": "WARNING",
+        "file_name": "",
+        "use_queue": True,
+        "debug_trace": False,
+    },
+    "Prefetch": {
+        "rate": 2.0,
+        "max_workers": 2,
+    },
+    "Server": {
+        "host": "127.0.0.1",
+        "port": 8000,
+        "max_workers": 8,
+    },
+    "Metrics": {
+        "enabled": False,
+        "dump_path": "metrics.json",
+    },
+    "GUI": {
+        "page_size": 200,
+        "search_debounce_ms": 150,
+    },
+}
+
+# 本の情報の項目
+BOOK_INFO_COLUMNS = ('isbn_10', 'isbn_13', 'title', 'author', 'publisher', 'subject', 'number', 'remarks', 'place')
+# 全文検索インデックスに登録する項目
+FTS_COLUMNS = ('title', 'author', 'publisher', 'subject', 'remarks', 'place')
+# ダウンロード用データの列名と本の情報の項目の対応
+DOWNLOAD_COLUMNS = {
+    "isbn": "isbn_10",
+    "タイトル": "title",
+    "著者": "author",
+    "出版社": "publisher",
+    "件名標目": "subject",
+    "保管場所": "place",
+    "所持数": "number",
+    "備考": "remarks",
+}
+
 # データベースモデルの定義
 BASE = declarative_base()
 
@@ -39,32 +144,57 @@ class Book(BASE):
     created_at = Column(DateTime)                                       # 作成日時
     updated_at = Column(DateTime)                                       # 更新日時
 
+# 検索結果の1行(ORMのインスタンスを作らずに必要な列のみ取得する)
+class BookRow(NamedTuple):
+    isbn_10: str
+    isbn_13: str
+    title: str
+    author: str
+    publisher: str
+    subject: str
+    place: str
+    number: str
+    remarks: str
+
+BOOK_ROW_COLUMNS = tuple(getattr(Book, column) for column in BookRow._fields)
+
 class Database:
-    def __init__(self):
+    def __init__(self, http_session=None):
+        """データベース
+
+        Args:
+            http_session (requests.Session): APIクライアントで共有するHTTPセッション(省略時は設定ファイルの値で作成)
+        """
         #self.logger = getLogger("uvicorn.app")
         self.logger = getLogger(__name__)
-        self.databse_url = "sqlite:///db.sqlite3"
+        self.config_path = "config.ini"
+        # configファイルがなかった場合は作成し、不足している項目はデフォルト値で補完
+        self.settings = Settings(self.config_path, DEFAULT_CONFIG)
+
+        self.database_path = self.settings.get('Database', 'file_name')
+        # キャッシュなどの付属ファイルはデータベースと同じ場所に置く(作業ディレクトリが変わっても同じ場所を使うよう絶対パスにする)
+        self.database_dir = os.path.dirname(os.path.abspath(self.database_path))
+        os.makedirs(self.database_dir, exist_ok=True)
+        self.databse_url = f"sqlite:///{os.path.abspath(self.database_path)}"
         self.engine = create_engine(self.databse_url)
+        # 接続ごとにストレージのプロファイルのPRAGMA(WALなど)を設定する
+        # (WALはネットワーク共有上では使えないため、既定値はdefaultとし、ネットワーク共有上ではWALを使わない)
+        self.storage_profile = self.settings.get('Database', 'storage_profile')
+        self.pragmas = adjust_pragmas_for_path(resolve_pragmas(self.storage_profile, self.settings.get('Database', 'pragma_overrides')), self.database_path)
+        apply_pragmas(self.engine, self.pragmas)
+        # 作業単位の中で失敗した処理だけを取り消せるよう、SAVEPOINTを使えるようにする
+        enable_savepoints(self.engine)
         self.session_local = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        # unit_of_work()の中ではスレッドごとに1つのセッションを使い回す
+        self.scoped_session = scoped_session(self.session_local)
+        self.unit_of_work_state = threading.local()
 
         BASE.metadata.create_all(bind=self.engine)
+        self.fts_enabled = self.create_fts_index()
 
-        self.config_path = "config.ini"
-        self.config = ConfigParser()
-        self.config.read(self.config_path)
-
-
-        # configファイルがなかった場合は作成
-        if not os.path.exists(self.config_path):
-            self.logger.info(f"Creating config file")
-
-            self.config['BookSearch'] = {}
-            self.set_config('BookSearch', 'search_timeout', '5')
-            self.set_config('BookSearch', 'openbd', 'True')
-            self.set_config('BookSearch', 'open_library', 'True')
-            self.set_config('BookSearch', 'google_books', 'True')
-            self.set_config('BookSearch', 'ndl', 'True')
-            self.set_config('BookSearch', 'search_order', 'ndl,open_library,google_books,openbd')
+        # 処理時間の計測(無効な場合はほとんど負荷がかからない)
+        self.metrics = METRICS
+        self.metrics.enabled = self.settings.get('Metrics', 'enabled')
 
         self.book_search_apis = {
             "openbd": OpenBDAPI,
@@ -72,6 +202,198 @@ class Database:
             "google_books": GoogleBooksAPI,
             "ndl": NDLAPI,
         }
+        # APIクライアントは共有のHTTPセッションで接続を使い回す(接続プールはAPIと置き換え先のホストの数だけ保持する)
+        if http_session is None:
+            host_overrides = parse_host_overrides(self.settings.get('HTTP', 'host_overrides'))
+            http_session = create_http_session(self.settings.get('HTTP', 'pool_maxsize'), host_overrides, pool_connections=len(self.book_search_apis) + len(host_overrides))
+        self.http_session = http_session
+        self.search_api_clients = {}
+        self.search_api_lock = threading.Lock()
+        self.rate_limiters = {api_name: RateLimiter(self.settings.get('RateLimit', api_name)) for api_name in self.book_search_apis}
+        # 同じISBNの検索が同時に呼び出された場合は、APIへの問い合わせを1回にまとめる
+        self.isbn_search_flight = SingleFlight()
+        self.isbn_search_saved_requests = 0
+        # 事前取得した本の情報(キャッシュが無効の場合のみ使う)
+        self.prefetched_books = {}
+
+        # APIの検索結果のキャッシュ(db.sqlite3と同じ場所に保存)
+        if self.settings.get('BookSearchCache', 'enabled'):
+            cache_path = os.path.join(self.database_dir, self.settings.get('BookSearchCache', 'file_name'))
+            self.search_cache = BookSearchCache(
+                cache_path,
+                ttl=self.settings.get('BookSearchCache', 'ttl'),
+                negative_ttl=self.settings.get('BookSearchCache', 'negative_ttl'),
+                max_entries=self.settings.get('BookSearchCache', 'max_entries'),
+                pragmas=adjust_pragmas_for_path(resolve_pragmas(self.settings.get('BookSearchCache', 'storage_profile')), cache_path),
+            )
+        else:
+            self.search_cache = None
+
+        # APIごとの統計情報とサーキットブレーカー
+        if self.settings.get('ProviderHealth', 'enabled'):
+            self.provider_health = ProviderHealth(
+                os.path.join(self.database_dir, self.settings.get('ProviderHealth', 'file_name')),
+                failure_threshold=self.settings.get('ProviderHealth', 'failure_threshold'),
+                open_seconds=self.settings.get('ProviderHealth', 'open_seconds'),
+                error_rate_threshold=self.settings.get('ProviderHealth', 'error_rate_threshold'),
+                slow_latency=self.settings.get('ProviderHealth', 'slow_latency'),
+                adaptive_order=self.settings.get('ProviderHealth', 'adaptive_order'),
+            )
+        else:
+            self.provider_health = None
+
+    # 作業単位を開始する
+    @contextmanager
+    def unit_of_work(self):
+        """複数の処理で1つのセッション(接続とトランザクション)を使い回す作業単位を開始する
+
+        with文の中で呼び出したDatabaseのメソッドは同じセッションを使い、抜けるときにまとめてコミットする。
+        例外で抜けた場合はすべてロールバックする。中のメソッドが失敗した場合は、そのメソッドの変更だけを
+        SAVEPOINTまで戻し、それまでに成功したメソッドの変更は残す。セッションはスレッドごとに分かれるため、
+        ワーカースレッドからもそのまま使える。入れ子にした場合は一番外側で1回だけコミットする。
+        書き込みのための作業単位のため、開始時に書き込みロックを取る(BEGIN IMMEDIATE)。
+        読み込みだけの処理や、APIへの問い合わせなど時間のかかる処理は作業単位の外で行うこと。
+
+            with db.unit_of_work():
+                if not db.check_book_exist(isbn_a):
+                    db.register_book(book_info_a)
+                db.update_book(**book_info_b)
+
+        Yields:
+            Session: セッション
+        """
+        depth = getattr(self.unit_of_work_state, 'depth', 0)
+        session = self.scoped_session()
+        self.unit_of_work_state.depth = depth + 1
+        try:
+            if depth == 0:
+                session.connection(execution_options={BEGIN_IMMEDIATE: True})
+            yield session
+            if depth == 0:
+                session.commit()
+        except:
+            if depth == 0:
+                session.rollback()
+            raise
+        finally:
+            self.unit_of_work_state.depth = depth
+            if depth == 0:
+                self.scoped_session.remove()
+
+    # 作業単位の中かどうか
+    def in_unit_of_work(self) -> bool:
+        return getattr(self.unit_of_work_state, 'depth', 0) > 0
+
+    # セッションを取得する
+    @contextmanager
+    def session_scope(self):
+        """作業単位の中の場合はそのセッションを、それ以外は新しいセッションを使い、抜けるときに閉じる
+
+        Yields:
+            Session: セッション
+        """
+        if self.in_unit_of_work():
+            yield self.scoped_session()
+            return
+        session = self.session_local()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    # 書き込み用のセッションを取得する
+    @contextmanager
+    def write_scope(self):
+        """書き込み用のセッションを取得し、例外で抜けた場合はこの中の変更だけを取り消す
+
+        作業単位の中ではSAVEPOINTを作り、失敗した場合はそこまで戻す(作業単位の他の変更は残る)。
+        作業単位の外では書き込みロックを取った(BEGIN IMMEDIATE)新しいセッションを使い、失敗した場合はロールバックする。
+
+        Yields:
+            Session: セッション
+        """
+        if self.in_unit_of_work():
+            session = self.scoped_session()
+            savepoint = session.begin_nested()
+            try:
+                yield session
+            except:
+                # フラッシュに失敗した場合もSAVEPOINTまで戻し、セッションを使える状態に戻す
+                savepoint.rollback()
+                raise
+            savepoint.commit()
+            return
+        session = self.session_local()
+        try:
+            session.connection(execution_options={BEGIN_IMMEDIATE: True})
+            yield session
+        except:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    # 変更を確定する
+    def commit_session(self, session) -> None:
+        """作業単位の外ではコミットし、中ではまとめてコミットするためにフラッシュのみ行う"""
+        if self.in_unit_of_work():
+            session.flush()
+        else:
+            session.commit()
+
+    # 全文検索インデックスを作成する
+    def create_fts_index(self) -> bool:
+        """全文検索インデックス(FTS5、trigramトークナイザ)を作成する
+
+        booksテーブルの変更はトリガーでインデックスに反映する。
+
+        インデックスはbooksテーブルの暗黙のrowidで本と対応付ける(主キーがTEXTのため、rowidの別名になる列がない)。
+        VACUUMはこのrowidを振り直すことがあり、そのままでは検索結果が別の本になるため、VACUUMは
+        必ずvacuum()で行い、他のツールでVACUUMした場合はrebuild_fts_index()でインデックスを作り直すこと。
+
+        Returns:
+            bool: 全文検索インデックスが使えるかどうか
+        """
+        columns = ', '.join(FTS_COLUMNS)
+        new_columns = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+        old_columns = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+        try:
+            with self.engine.begin() as connection:
+                exists = connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type='table' AND name='books_fts'").first()
+                if exists is not None:
+                    return True
+                self.logger.info("Creating full-text search index")
+                connection.exec_driver_sql(f"CREATE VIRTUAL TABLE books_fts USING fts5({columns}, content='books', content_rowid='rowid', tokenize='trigram')")
+                connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN INSERT INTO books_fts(rowid, {columns}) VALUES (new.rowid, {new_columns}); END")
+                connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN INSERT INTO books_fts(books_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_columns}); END")
+                connection.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE ON books BEGIN INSERT INTO books_fts(books_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_columns}); INSERT INTO books_fts(rowid, {columns}) VALUES (new.rowid, {new_columns}); END")
+                connection.exec_driver_sql("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+        except sqlalchemy.exc.OperationalError:
+            # FTS5やtrigramトークナイザに対応していないSQLiteの場合はLIKEで検索する
+            self.logger.warning("Full-text search is not available", exc_info=True)
+            return False
+        return True
+
+    # 全文検索インデックスを作り直す
+    def rebuild_fts_index(self) -> None:
+        """全文検索インデックスをbooksテーブルの内容から作り直す(rowidが変わった後に使う)"""
+        if not self.fts_enabled:
+            return
+        self.logger.info("Rebuilding full-text search index")
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+    # データベースを最適化する
+    def vacuum(self) -> None:
+        """データベースをVACUUMで最適化し、rowidが振り直されても検索できるよう全文検索インデックスを作り直す"""
+        self.logger.info("Vacuuming database: %s", self.database_path)
+        # VACUUMはトランザクションの中では実行できないため、SQLAlchemyのBEGINを通さずに実行する
+        connection = self.engine.raw_connection()
+        try:
+            connection.driver_connection.execute("VACUUM")
+        finally:
+            connection.close()
+        self.rebuild_fts_index()
 
     # 設定ファイルを取得する
     def get_config(self, section: str, key: str) -> str:
@@ -84,8 +406,7 @@ class Database:
         Returns:
             str: 設定値
         """
-        self.logger.info(f"Getting config: section={section}, key={key}")
-        return self.config[section][key]
+        return self.settings.get_raw(section, key)
 
     # 設定ファイルを設定する
     def set_config(self, section: str, key: str, value: str) -> None:
@@ -96,122 +417,459 @@ class Database:
             key (str): キー名
             value (str): 設定値
         """
-        self.logger.info(f"Setting config: section={section}, key={key}, value={value}")
-        self.config[section][key] = value
-        with open(self.config_path, "w") as f:
-            self.config.write(f)
+        self.logger.debug("Setting config: section=%s, key=%s, value=%s", section, key, value)
+        self.settings.set(section, key, value)
 
     # ISBNから本を検索する
-    def isbn_search_book(self, isbn: str) -> dict:
+    @timed('isbn_search_book')
+    def isbn_search_book(self, isbn: str, check_exists: bool=True) -> dict:
         """ISBNから本をインターネット上の情報から検索する
         
         Args:
             isbn (str): ISBN
+            check_exists (bool): 登録済みかどうかを確認するかどうか(呼び出し元で確認済みの場合はFalse)
 
         Returns:
-            dict: 本の情報
+            dict: 本の情報(登録済みの場合はNone)
         """
-        self.logger.info(f"ISBN search book: isbn={isbn}")
-        search_order = self.get_config('BookSearch', 'search_order').split(',')
+        self.logger.debug("ISBN search book: isbn=%s", isbn)
+        search_order = self.settings.get('BookSearch', 'search_order')
         try:
             isbn_10, isbn_13 = calc_both_isbn(isbn)
         except ValueError:
-            self.logger.error(f"Invalid ISBN: {isbn}")
+            self.logger.error("Invalid ISBN: %s", isbn)
             return None
         # 既にデータベースに登録されているかの確認
-        session = self.session_local()
-        book = session.query(Book).filter(Book.isbn_10 == isbn_10).first()
-        session.close()
-        if book:
+        if check_exists and self.check_book_exist(isbn_10):
             return None
+        api_names = [api_name for api_name in search_order if self.settings.get('BookSearch', api_name)]
+        if self.provider_health is not None:
+            # 調子の悪いAPIは後回しにする
+            api_names = self.provider_health.order(api_names)
+        book_info, shared = self.isbn_search_flight.do(isbn_13, self.search_providers, api_names, isbn_10, isbn_13)
+        if shared:
+            self.logger.debug("ISBN search shared with in-flight lookup: isbn_13=%s", isbn_13)
+            with self.search_api_lock:
+                self.isbn_search_saved_requests += len(api_names)
+            self.metrics.increment('isbn_search_coalesced')
+            self.metrics.increment('provider_requests_saved', len(api_names))
+            # 呼び出し元ごとに変更できるよう複製して返す
+            return dict(book_info) if book_info is not None else None
+        return book_info
+
+    # 各APIに問い合わせて結果をまとめる
+    def search_providers(self, api_names: list[str], isbn_10: str, isbn_13: str) -> dict:
+        """各APIに問い合わせて結果をまとめる
+
+        Args:
+            api_names (list[str]): 問い合わせるAPI名(優先順)
+            isbn_10 (str): ISBN10
+            isbn_13 (str): ISBN13
+
+        Returns:
+            dict: 本の情報(どのAPIでも見つからなかった場合はNone)
+        """
+        if self.settings.get('BookSearch', 'concurrent_search'):
+            data_list = self.search_providers_concurrently(api_names, isbn_10, isbn_13)
+        else:
+            data_list = []
+            for api_name in api_names:
+                data = self.search_provider(api_name, isbn_13)
+                if data is not None:
+                    data_list.append(data)
+
+        if len(data_list) > 0:
+            return self.merge_book_info(isbn_10, isbn_13, data_list)
+        else:
+            return None
+
+    # 各APIに並列で問い合わせる
+    def search_providers_concurrently(self, api_names: list[str], isbn_10: str, isbn_13: str) -> list[dict]:
+        """各APIに並列で問い合わせ、search_orderの優先順で結果を返す
+
+        優先度の高いAPIから順に結果を確定させ、その時点で全ての項目が埋まった場合は
+        残りのAPIの応答を待たずに返す。待たなかった問い合わせは通信が終わるまで実行されるが、
+        呼び出し元が戻った後にキャッシュへ書き込まないよう、結果は保存しない。
+
+        Args:
+            api_names (list[str]): 優先順に並んだAPI名
+            isbn_10 (str): ISBN10
+            isbn_13 (str): ISBN13
+
+        Returns:
+            list[dict]: 優先順に並んだ各APIの検索結果
+        """
         data_list = []
-        for api_name in search_order:
-            if self.get_config('BookSearch', api_name) == 'True':
-                if api_name == 'ndl':
-                    self.logger.info(f"Searching book NDL: isbn_10={isbn_10}, isbn_13={isbn_13}")
-                    for isbn in [isbn_13]:
-                        data = self.book_search_apis[api_name](timeout=float(self.get_config('BookSearch', 'search_timeout'))).isbn_search(isbn)
-                        record_data = data.get('searchRetrieveResponse',{}).get('records',{}).get('record',{})
-                        if isinstance(record_data, list):
-                            record_data = record_data[0]
-                        record_data = record_data.get('recordData',{}).get('srw_dc:dc',{})
-                        
-                        if isinstance(record_data.get('dc:creator',''), list):
-                            author = ', '.join(record_data.get('dc:creator',''))
-                        else:
-                            author = record_data.get('dc:creator','')
-                        if isinstance(record_data.get('dc:publisher',''), list):
-                            publisher = ', '.join(record_data.get('dc:publisher',''))
-                        else:
-                            publisher = record_data.get('dc:publisher','')
-                        if isinstance(record_data.get('dc:subject',''), list):
-                            subject = ', '.join(record_data.get('dc:subject',''))
-                        else:
-                            subject = record_data.get('dc:subject','')
-                        ndl_data = {
-                            'title': record_data.get('dc:title',''),
-                            'author': author,
-                            'publisher': publisher,
-                            'subject': subject,
-                        }
-                        data_list.append(ndl_data)
-                elif api_name == 'google_books':
-                    self.logger.info(f"Searching book Google Books: isbn_10={isbn_10}, isbn_13={isbn_13}")
-                    for isbn in [isbn_13]:
-                        data = self.book_search_apis[api_name](timeout=float(self.get_config('BookSearch', 'search_timeout'))).isbn_search(isbn)
-                        if data is not None:
-                            items = data.get('items',[])
-                            if len(items) > 0:
-                                google_books_data = {
-                                    'title': items[0].get('volumeInfo',{}).get('title',''),
-                                    'author': ', '.join(items[0].get('volumeInfo',{}).get('authors',[])),
-                                    'publisher': items[0].get('volumeInfo',{}).get('publisher',''),
-                                    'subject': ', '.join(items[0].get('volumeInfo',{}).get('categories',[])),
-                                }
-                                data_list.append(google_books_data)
-                elif api_name == 'openbd':
-                    self.logger.info(f"Searching book OpenBD: isbn_10={isbn_10}, isbn_13={isbn_13}")
-                    for isbn in [isbn_13]:
-                        data = self.book_search_apis[api_name](timeout=float(self.get_config('BookSearch', 'search_timeout'))).isbn_search(isbn)
-                        
-                        if data[0] is not None and len(data) > 0:
-                            if isinstance(data[0].get('summary',{}).get('author',[]), list):
-                                author = ', '.join(data[0].get('summary',{}).get('author',[]))
-                            else:
-                                author = data[0].get('summary',{}).get('author','')
-                            if isinstance(data[0].get('summary',{}).get('publisher',[]), list):
-                                publisher = ', '.join(data[0].get('summary',{}).get('publisher',[]))
-                            else:
-                                publisher = data[0].get('summary',{}).get('publisher','')
-                            openbd_data = {
-                                'title': data[0].get('summary',{}).get('title',''),
-                                'author': author,
-                                'publisher': publisher,
-                                'subject': ''
-                            }
-                            data_list.append(openbd_data)
-                elif api_name == 'open_library':
-                    self.logger.info(f"Searching book Open Library: isbn_10={isbn_10}, isbn_13={isbn_13}")
-                    for isbn in [isbn_13]:
-                        data = self.book_search_apis[api_name](timeout=float(self.get_config('BookSearch', 'search_timeout'))).isbn_search(isbn)
-                        if data is not None:
-                            authors = []
-                            for author in data.get('authors',[]):
-                                if 'key' in author.keys():
-                                    author_info = self.book_search_apis[api_name](timeout=float(self.get_config('BookSearch', 'search_timeout'))).author_search(author['key'])
-                                    if author_info and 'name' in author_info.keys():
-                                        authors.append(author_info.get('name',''))
-                            open_library_data = {
-                                'title': data.get('title',''),
-                                'author': ', '.join(authors),
-                                'publisher': data.get('publishers',[])[0],
-                                'subject': ', '.join(data.get('subjects',[])),
-                            }
-                            data_list.append(open_library_data)
-                    pass
-                else:
-                    assert Exception(f"Invalid API name: {api_name}")
-        
+        if len(api_names) == 0:
+            return data_list
+        max_workers = min(len(api_names), self.settings.get('BookSearch', 'max_workers'))
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="book_search")
+        abandoned = threading.Event()
+        try:
+            futures = [executor.submit(self.search_provider, api_name, isbn_13, abandoned) for api_name in api_names]
+            for api_name, future in zip(api_names, futures):
+                data = future.result()
+                if data is None:
+                    continue
+                data_list.append(data)
+                if is_book_info_complete(self.merge_book_info(isbn_10, isbn_13, data_list)):
+                    self.logger.debug("All fields filled by %s, skipping remaining APIs", api_name)
+                    break
+        finally:
+            # 応答待ちのAPIは待たずに打ち切る(実行中の問い合わせは結果を保存しない)
+            abandoned.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+        return data_list
+
+    # 指定したAPIで本を検索する
+    def search_provider(self, api_name: str, isbn_13: str, abandoned: threading.Event=None) -> dict:
+        """指定したAPIで本を検索する
+
+        Args:
+            api_name (str): API名
+            isbn_13 (str): ISBN13
+            abandoned (threading.Event): 設定された場合は呼び出し元が結果を待たずに戻ったため、結果の保存や失敗の記録をしない
+
+        Returns:
+            dict: 本の情報(見つからなかった場合や通信に失敗した場合はNone)
+        """
+        search_functions = {
+            "ndl": self.search_ndl,
+            "google_books": self.search_google_books,
+            "openbd": self.search_openbd,
+            "open_library": self.search_open_library,
+        }
+        if api_name not in search_functions:
+            self.logger.error("Invalid API name: %s", api_name)
+            return None
+        if self.search_cache is not None:
+            hit, data = self.search_cache.get(api_name, isbn_13)
+            if hit:
+                self.logger.debug("Search cache hit: api=%s, isbn_13=%s", api_name, isbn_13)
+                self.metrics.increment('search_cache_hits', provider=api_name)
+                return data
+            self.metrics.increment('search_cache_misses', provider=api_name)
+        if self.provider_health is not None and not self.provider_health.allow(api_name):
+            self.logger.debug("Skipping API while circuit is open: api=%s", api_name)
+            self.metrics.increment('provider_skipped', provider=api_name)
+            return None
+        start = time.perf_counter()
+        try:
+            data = search_functions[api_name](isbn_13)
+        except Exception:
+            if abandoned is not None and abandoned.is_set():
+                # 呼び出し元が戻った後の失敗(終了処理中など)はAPIの障害として記録しない
+                self.logger.debug("Abandoned search failed: api=%s, isbn_13=%s", api_name, isbn_13, exc_info=True)
+                return None
+            # 通信エラーは見つからなかった結果としてキャッシュしない
+            self.logger.error("Failed to search book: api=%s, isbn_13=%s", api_name, isbn_13, exc_info=True)
+            self.metrics.observe('provider_request', time.perf_counter() - start, provider=api_name)
+            self.metrics.increment('provider_errors', provider=api_name)
+            if self.provider_health is not None:
+                self.provider_health.record_failure(api_name, time.perf_counter() - start)
+            return None
+        self.metrics.observe('provider_request', time.perf_counter() - start, provider=api_name)
+        if self.provider_health is not None:
+            completeness = sum(1 for key in ('title', 'author', 'publisher', 'subject') if data and data.get(key)) / 4
+            self.provider_health.record_success(api_name, time.perf_counter() - start, completeness)
+        if self.search_cache is not None and not (abandoned is not None and abandoned.is_set()):
+            self.search_cache.set(api_name, isbn_13, data, time.perf_counter() - start)
+        return data
+
+    # APIごとの統計情報を取得する
+    def get_provider_health(self) -> dict:
+        """APIごとの応答時間・エラー率・項目の充足率とサーキットの状態を取得する
+
+        Returns:
+            dict: APIごとの統計情報(無効の場合はNone)
+        """
+        if self.provider_health is None:
+            return None
+        return self.provider_health.snapshot()
+
+    # 計測結果を取得する
+    def get_metrics(self) -> dict:
+        """処理時間の計測結果と、検索結果のキャッシュ・APIごとの統計情報をまとめて取得する
+
+        Returns:
+            dict: 計測結果
+        """
+        snapshot = self.metrics.snapshot()
+        snapshot["search_cache"] = self.get_search_cache_stats()
+        snapshot["isbn_search_flight"] = self.get_isbn_search_flight_stats()
+        snapshot["provider_health"] = self.get_provider_health()
+        return snapshot
+
+    # 計測結果をファイルに出力する
+    def dump_metrics(self, path: str=None) -> str:
+        """計測結果をファイルに出力する(拡張子が.promの場合はPrometheusのテキスト形式、それ以外はJSON)
+
+        Args:
+            path (str): 出力先(省略時は設定ファイルの値)
+
+        Returns:
+            str: 出力先
+        """
+        path = path or self.settings.get('Metrics', 'dump_path')
+        if path.endswith(".prom"):
+            self.metrics.dump(path)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.get_metrics(), f, ensure_ascii=False, indent=2)
+        return path
+
+    # 事前取得した本の情報を保存する
+    def store_prefetched_book_info(self, isbn_13: str, book_info: dict, latency: float=0.0) -> None:
+        """事前取得した本の情報を保存する(キャッシュが有効な場合はキャッシュに、無効な場合はメモリに保存する)
+
+        Args:
+            isbn_13 (str): ISBN13
+            book_info (dict): 本の情報(見つからなかった場合はNone)
+            latency (float): 検索にかかった時間(秒)
+        """
+        if self.search_cache is not None:
+            self.search_cache.set(MERGED_PROVIDER, isbn_13, book_info, latency)
+        else:
+            with self.search_api_lock:
+                self.prefetched_books[isbn_13] = book_info
+
+    # 事前取得した本の情報を取得する
+    def get_prefetched_book_info(self, isbn_13: str) -> tuple[bool, dict]:
+        """事前取得した本の情報を取得する
+
+        Args:
+            isbn_13 (str): ISBN13
+
+        Returns:
+            tuple[bool, dict]: 事前取得済みかどうかと本の情報(見つからなかった場合はNone)
+        """
+        if self.search_cache is not None:
+            # APIの検索結果のヒット率に影響しないよう、ヒット数・ミス数には数えない
+            return self.search_cache.get(MERGED_PROVIDER, isbn_13, count_stats=False)
+        with self.search_api_lock:
+            if isbn_13 in self.prefetched_books:
+                return True, self.prefetched_books[isbn_13]
+        return False, None
+
+    # 同じISBNの検索をまとめた回数を取得する
+    def get_isbn_search_flight_stats(self) -> dict:
+        """同じISBNの検索をまとめた回数を取得する
+
+        Returns:
+            dict: 実際に検索した回数(executed)、実行中の検索の結果を共有した回数(shared)、
+                  検索中のISBNの数(in_flight)、共有により省略できたAPIへの問い合わせ数(saved_requests)
+        """
+        stats = self.isbn_search_flight.stats()
+        stats["saved_requests"] = self.isbn_search_saved_requests
+        return stats
+
+    # 検索結果のキャッシュの統計情報を取得する
+    def get_search_cache_stats(self) -> dict:
+        """検索結果のキャッシュの統計情報を取得する
+
+        Returns:
+            dict: ヒット数、ミス数、ヒット率、ヒットにより省略できた通信時間(秒)、保存件数(キャッシュが無効の場合はNone)
+        """
+        if self.search_cache is None:
+            return None
+        return self.search_cache.stats()
+
+    # APIクライアントを取得する
+    def get_search_api(self, api_name: str):
+        """APIクライアントを取得する
+
+        クライアントは作成後に再利用し、共有のHTTPセッションで接続を使い回す。
+
+        Args:
+            api_name (str): API名
+
+        Returns:
+            APIクライアント
+        """
+        # クライアントは1リクエストごとに取得するため、ここでリクエスト数を制限する
+        self.rate_limiters[api_name].acquire()
+        timeout = self.settings.get('BookSearch', 'search_timeout')
+        with self.search_api_lock:
+            client = self.search_api_clients.get((api_name, timeout))
+            if client is None:
+                client = self.create_search_api(api_name, timeout)
+                self.search_api_clients[(api_name, timeout)] = client
+        return client
+
+    # APIクライアントを作成する
+    def create_search_api(self, api_name: str, timeout: float):
+        """共有のHTTPセッションを使うAPIクライアントを作成する
+
+        Args:
+            api_name (str): API名
+            timeout (float): タイムアウト(秒)
+
+        Returns:
+            APIクライアント
+        """
+        api_class = self.book_search_apis[api_name]
+        if 'session' in inspect.signature(api_class).parameters:
+            return api_class(timeout=timeout, session=self.http_session)
+        client = api_class(timeout=timeout)
+        # コンストラクタでセッションを受け取らないクライアントは、クライアント自身が持つセッションのみ置き換える
+        # (どちらもない場合、そのAPIには接続の使い回しとホストの置き換えが効かない)
+        if not attach_http_session(client, self.http_session):
+            self.logger.warning("API client does not use the shared HTTP session (no connection pooling or host overrides): api=%s", api_name)
+        return client
+
+    # 国立国会図書館サーチで本を検索する
+    def search_ndl(self, isbn_13: str) -> dict:
+        """国立国会図書館サーチで本を検索する
+
+        Args:
+            isbn_13 (str): ISBN13
+
+        Returns:
+            dict: 本の情報(見つからなかった場合はNone)
+        """
+        self.logger.debug("Searching book NDL: isbn_13=%s", isbn_13)
+        data = self.get_search_api('ndl').isbn_search(isbn_13)
+        if data is None:
+            return None
+        # 見つからなかった場合もレコードが空の応答が返るため、Noneにして短い期間だけキャッシュする
+        records = data.get('searchRetrieveResponse',{}).get('records')
+        if not records:
+            return None
+        record_data = records.get('record',{})
+        if isinstance(record_data, list):
+            if len(record_data) == 0:
+                return None
+            record_data = record_data[0]
+        record_data = record_data.get('recordData',{}).get('srw_dc:dc',{})
+
+        if isinstance(record_data.get('dc:creator',''), list):
+            author = ', '.join(record_data.get('dc:creator',''))
+        else:
+            author = record_data.get('dc:creator','')
+        if isinstance(record_data.get('dc:publisher',''), list):
+            publisher = ', '.join(record_data.get('dc:publisher',''))
+        else:
+            publisher = record_data.get('dc:publisher','')
+        if isinstance(record_data.get('dc:subject',''), list):
+            subject = ', '.join(record_data.get('dc:subject',''))
+        else:
+            subject = record_data.get('dc:subject','')
+        return {
+            'title': record_data.get('dc:title',''),
+            'author': author,
+            'publisher': publisher,
+            'subject': subject,
+        }
+
+    # Google Booksで本を検索する
+    def search_google_books(self, isbn_13: str) -> dict:
+        """Google Booksで本を検索する
+
+        Args:
+            isbn_13 (str): ISBN13
+
+        Returns:
+            dict: 本の情報
+        """
+        self.logger.debug("Searching book Google Books: isbn_13=%s", isbn_13)
+        data = self.get_search_api('google_books').isbn_search(isbn_13)
+        if data is None:
+            return None
+        items = data.get('items',[])
+        if len(items) == 0:
+            return None
+        return {
+            'title': items[0].get('volumeInfo',{}).get('title',''),
+            'author': ', '.join(items[0].get('volumeInfo',{}).get('authors',[])),
+            'publisher': items[0].get('volumeInfo',{}).get('publisher',''),
+            'subject': ', '.join(items[0].get('volumeInfo',{}).get('categories',[])),
+        }
+
+    # openBDで本を検索する
+    def search_openbd(self, isbn_13: str) -> dict:
+        """openBDで本を検索する
+
+        Args:
+            isbn_13 (str): ISBN13
+
+        Returns:
+            dict: 本の情報
+        """
+        self.logger.debug("Searching book OpenBD: isbn_13=%s", isbn_13)
+        data = self.get_search_api('openbd').isbn_search(isbn_13)
+        if not data or data[0] is None:
+            return None
+        if isinstance(data[0].get('summary',{}).get('author',[]), list):
+            author = ', '.join(data[0].get('summary',{}).get('author',[]))
+        else:
+            author = data[0].get('summary',{}).get('author','')
+        if isinstance(data[0].get('summary',{}).get('publisher',[]), list):
+            publisher = ', '.join(data[0].get('summary',{}).get('publisher',[]))
+        else:
+            publisher = data[0].get('summary',{}).get('publisher','')
+        return {
+            'title': data[0].get('summary',{}).get('title',''),
+            'author': author,
+            'publisher': publisher,
+            'subject': ''
+        }
+
+    # Open Libraryで本を検索する
+    def search_open_library(self, isbn_13: str) -> dict:
+        """Open Libraryで本を検索する
+
+        著者情報は著者ごとに別のリクエストが必要なため、並列検索が有効な場合はまとめて問い合わせる。
+
+        Args:
+            isbn_13 (str): ISBN13
+
+        Returns:
+            dict: 本の情報
+        """
+        self.logger.debug("Searching book Open Library: isbn_13=%s", isbn_13)
+        data = self.get_search_api('open_library').isbn_search(isbn_13)
+        if data is None:
+            return None
+        author_keys = [author['key'] for author in data.get('authors',[]) if 'key' in author.keys()]
+        if self.settings.get('BookSearch', 'concurrent_search') and len(author_keys) > 1:
+            max_workers = min(len(author_keys), self.settings.get('BookSearch', 'max_workers'))
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="author_search") as executor:
+                author_infos = list(executor.map(self.search_open_library_author, author_keys))
+        else:
+            author_infos = [self.search_open_library_author(author_key) for author_key in author_keys]
+        authors = [author_info.get('name','') for author_info in author_infos if author_info and 'name' in author_info.keys()]
+        return {
+            'title': data.get('title',''),
+            'author': ', '.join(authors),
+            'publisher': (data.get('publishers') or [''])[0],
+            'subject': ', '.join(data.get('subjects',[])),
+        }
+
+    # Open Libraryで著者を検索する
+    def search_open_library_author(self, author_key: str) -> dict:
+        """Open Libraryで著者を検索する
+
+        Args:
+            author_key (str): 著者のキー
+
+        Returns:
+            dict: 著者の情報
+        """
+        return self.get_search_api('open_library').author_search(author_key)
+
+    # 各APIの検索結果をまとめる
+    @timed('normalize')
+    def merge_book_info(self, isbn_10: str, isbn_13: str, data_list: list[dict]) -> dict:
+        """各APIの検索結果を優先順にまとめる
+
+        Args:
+            isbn_10 (str): ISBN10
+            isbn_13 (str): ISBN13
+            data_list (list[dict]): 優先順に並んだ各APIの検索結果
+
+        Returns:
+            dict: 本の情報
+        """
         data_dict = {
             'isbn_10': isbn_10,
             'isbn_13': isbn_13,
@@ -223,21 +881,19 @@ class Database:
             'remarks': '',
             'place': '',
         }
-        if len(data_list) > 0:
-            for data in data_list:
-                if len(data_dict['title']) == 0:
-                    data_dict['title'] = unicodedata.normalize('NFKC', data.get('title',''))
-                if len(data_dict['author']) == 0:
-                    data_dict['author'] = unicodedata.normalize('NFKC', data.get('author',''))
-                if len(data_dict['publisher']) == 0:
-                    data_dict['publisher'] = unicodedata.normalize('NFKC', data.get('publisher',''))
-                if len(data_dict['subject']) == 0:
-                    data_dict['subject'] = unicodedata.normalize('NFKC', data.get('subject',''))
-            return data_dict
-        else:
-            return None
+        for data in data_list:
+            if len(data_dict['title']) == 0:
+                data_dict['title'] = unicodedata.normalize('NFKC', data.get('title',''))
+            if len(data_dict['author']) == 0:
+                data_dict['author'] = unicodedata.normalize('NFKC', data.get('author',''))
+            if len(data_dict['publisher']) == 0:
+                data_dict['publisher'] = unicodedata.normalize('NFKC', data.get('publisher',''))
+            if len(data_dict['subject']) == 0:
+                data_dict['subject'] = unicodedata.normalize('NFKC', data.get('subject',''))
+        return data_dict
 
     # 本を登録する
+    @timed('register_book')
     def register_book(self, book_data: dict) -> bool:
         """本を登録する
         
@@ -247,25 +903,111 @@ class Database:
         Returns:
             bool: 本が登録されたかどうか
         """
-        self.logger.info(f"Registering book: book_data={book_data}")
-        session = self.session_local()
+        self.logger.debug("Registering book: book_data=%s", book_data)
         try:
-            book = Book(**book_data)
-            session.add(book)
-            session.commit()
-            session.refresh(book)
+            with self.write_scope() as session:
+                book = Book(**book_data)
+                session.add(book)
+                with self.metrics.timer('db_commit'):
+                    self.commit_session(session)
         except:
-            print(traceback.format_exc())
-            self.logger.error(f"Failed to register book: {book_data}")
-            session.rollback()
-            session.close()
+            self.logger.exception("Failed to register book: %s", book_data)
             return False
-        session.close()
-        self.logger.info(f"Book registered: {book_data}")
+        self.logger.debug("Book registered: %s", book_data)
         return True
 
+    # 複数の本をまとめて登録する
+    @timed('register_books')
+    def register_books(self, book_iterable, batch_size: int=None) -> dict:
+        """複数の本をまとめて登録する
+
+        登録済みかどうかはバッチごとに1回のクエリで確認し、バッチ単位でまとめて登録する。
+        各バッチは他の書き込みと同じくwrite_scope()で書き込む(作業単位の外ではバッチごとにコミットし、
+        中ではバッチごとのSAVEPOINTで作業単位の一部として書き込む)。
+
+        Args:
+            book_iterable (Iterable[dict]): 本の情報
+            batch_size (int): 1回のトランザクションで登録する本の数(省略時は設定ファイルの値)
+
+        Returns:
+            dict: 登録された本の数(registered)と登録できなかった本の一覧(conflicts)
+        """
+        batch_size = batch_size or self.settings.get('Database', 'bulk_batch_size')
+        self.logger.info("Registering books: batch_size=%s", batch_size)
+        registered = 0
+        conflicts = []
+        seen = set()
+        batch = []
+        for book_data in book_iterable:
+            batch.append(book_data)
+            if len(batch) >= batch_size:
+                registered += self._register_book_batch(batch, seen, conflicts)
+                batch = []
+        if len(batch) > 0:
+            registered += self._register_book_batch(batch, seen, conflicts)
+        self.logger.info("Books registered: registered=%s, conflicts=%s", registered, len(conflicts))
+        return {"registered": registered, "conflicts": conflicts}
+
+    def _register_book_batch(self, batch: list[dict], seen: set, conflicts: list[dict]) -> int:
+        """1バッチ分の本を登録する
+
+        Args:
+            batch (list[dict]): 本の情報
+            seen (set): この登録処理で既に処理したISBN10
+            conflicts (list[dict]): 登録できなかった本の一覧(追記される)
+
+        Returns:
+            int: 登録された本の数
+        """
+        batch_conflicts = []
+        batch_seen = set()
+        try:
+            with self.write_scope() as session:
+                isbn_10_list = [book_data.get('isbn_10') for book_data in batch]
+                isbn_13_list = [book_data.get('isbn_13') for book_data in batch]
+                exist_rows = session.query(Book.isbn_10, Book.isbn_13).filter(or_(Book.isbn_10.in_(isbn_10_list), Book.isbn_13.in_(isbn_13_list))).all()
+                exist_isbn = {isbn for row in exist_rows for isbn in row}
+                rows = []
+                for book_data in batch:
+                    isbn_10 = book_data.get('isbn_10')
+                    if isbn_10 in exist_isbn or book_data.get('isbn_13') in exist_isbn:
+                        batch_conflicts.append({"isbn_10": isbn_10, "isbn_13": book_data.get('isbn_13'), "reason": "exists"})
+                        continue
+                    if isbn_10 in seen or isbn_10 in batch_seen:
+                        batch_conflicts.append({"isbn_10": isbn_10, "isbn_13": book_data.get('isbn_13'), "reason": "duplicated"})
+                        continue
+                    batch_seen.add(isbn_10)
+                    rows.append({column: book_data.get(column, '') for column in BOOK_INFO_COLUMNS})
+                if len(rows) == 0:
+                    registered = 0
+                try:
+                    if len(rows) > 0:
+                        with session.begin_nested():
+                            session.execute(insert(Book), rows)
+                    registered = len(rows)
+                except sqlalchemy.exc.IntegrityError:
+                    # まとめて登録できなかった場合は1冊ずつ登録して失敗した本を特定する
+                    registered = 0
+                    for row in rows:
+                        try:
+                            with session.begin_nested():
+                                session.execute(insert(Book), [row])
+                            registered += 1
+                        except sqlalchemy.exc.IntegrityError as e:
+                            batch_conflicts.append({"isbn_10": row['isbn_10'], "isbn_13": row['isbn_13'], "reason": type(e).__name__})
+                self.commit_session(session)
+        except sqlalchemy.exc.SQLAlchemyError as e:
+            # ロックを待ちきれなかった場合などはバッチ全体を登録できなかった本とする
+            self.logger.exception("Failed to register book batch")
+            conflicts.extend({"isbn_10": book_data.get('isbn_10'), "isbn_13": book_data.get('isbn_13'), "reason": type(e).__name__} for book_data in batch)
+            return 0
+        seen.update(batch_seen)
+        conflicts.extend(batch_conflicts)
+        return registered
+
     # 本の検索を行う
-    def search_book(self, isbn: str='', title: str='', author: str='', publisher: str='', subject: str='', number: str='', remarks: str='', place: str='') -> list[dict]:
+    @timed('search_book')
+    def search_book(self, isbn: str='', title: str='', author: str='', publisher: str='', subject: str='', number: str='', remarks: str='', place: str='', limit: int=None, offset: int=0) -> list[dict]:
         """本の検索を行う
         
         Args:
@@ -275,48 +1017,85 @@ class Database:
             publisher (str): 出版社
             subject (str): サブジェクト
             place (str): 保管場所
+            limit (int): 取得する最大件数(Noneの場合は全件)
+            offset (int): 取得を開始する位置
 
         Returns:
             list: 本の情報
         """
-        self.logger.info(f"Searching book: isbn={isbn}, title={title}, author={author}, publisher={publisher}, subject={subject}, place={place}")
-        try:
-            session = self.session_local()
-            if len(isbn) > 0:
-                isbn_10, isbn_13 = calc_both_isbn(isbn)
-                search_result = session.query(Book).filter(Book.isbn_10 == isbn_10).all()
-            elif len(title)==0 and len(author)==0 and len(publisher)==0 and len(subject)==0 and len(number)==0 and len(remarks)==0 and len(place)==0:
-                search_result = session.query(Book).all()
+        return [row._asdict() for row in self.search_book_rows(isbn=isbn, title=title, author=author, publisher=publisher, subject=subject, number=number, remarks=remarks, place=place, limit=limit, offset=offset)]
+
+    # 本の検索を行い、軽量な行で返す
+    @timed('search_book_rows')
+    def search_book_rows(self, isbn: str='', title: str='', author: str='', publisher: str='', subject: str='', number: str='', remarks: str='', place: str='', limit: int=None, offset: int=0) -> list[BookRow]:
+        """本の検索を行い、ORMのインスタンスや辞書を作らずにBookRowで返す
+
+        引数はsearch_bookと同じ。
+
+        Returns:
+            list[BookRow]: 本の情報
+        """
+        self.logger.debug("Searching book: isbn=%s, title=%s, author=%s, publisher=%s, subject=%s, place=%s, limit=%s, offset=%s", isbn, title, author, publisher, subject, place, limit, offset)
+        statement = self.build_search_statement(BOOK_ROW_COLUMNS, isbn=isbn, title=title, author=author, publisher=publisher, subject=subject, number=number, remarks=remarks, place=place)
+        if limit is not None:
+            # ページごとに取得しても順番が変わらないよう登録順に並べる
+            statement = statement.order_by(sqlalchemy.literal_column("books.rowid")).limit(limit).offset(offset)
+        with self.session_scope() as session:
+            return list(map(BookRow._make, session.execute(statement)))
+
+    # 検索クエリを作成する
+    def build_search_statement(self, columns, isbn: str='', title: str='', author: str='', publisher: str='', subject: str='', number: str='', remarks: str='', place: str=''):
+        """検索クエリを作成する
+
+        ISBNが指定された場合はISBNのみで検索し、条件が1つも指定されていない場合は全件を対象とする。
+
+        Args:
+            columns: 取得する列
+
+        Returns:
+            Select: 検索クエリ
+        """
+        if len(isbn) > 0:
+            isbn_10, isbn_13 = calc_both_isbn(isbn)
+            return select(*columns).where(Book.isbn_10 == isbn_10)
+        search_conditions = self.build_search_conditions(title=title, author=author, publisher=publisher, subject=subject, number=number, remarks=remarks, place=place)
+        return select(*columns).where(*search_conditions)
+
+    # 検索条件を作成する
+    def build_search_conditions(self, title: str='', author: str='', publisher: str='', subject: str='', number: str='', remarks: str='', place: str='') -> list:
+        """検索条件を作成する
+
+        全文検索インデックスが使える場合、3文字以上の検索語はインデックスで部分一致検索し、
+        それ以外はLIKEで部分一致検索する。
+
+        Returns:
+            list: 検索条件
+        """
+        search_terms = {
+            "title": title,
+            "author": author,
+            "publisher": publisher,
+            "subject": subject,
+            "number": number,
+            "remarks": remarks,
+            "place": place,
+        }
+        search_conditions = []
+        fts_queries = []
+        for column, term in search_terms.items():
+            if len(term) == 0:
+                continue
+            # trigramトークナイザは3文字未満の検索語に使えない
+            if self.fts_enabled and column in FTS_COLUMNS and len(term) >= 3:
+                fts_queries.append(f'{column} : "{term.replace(chr(34), chr(34) * 2)}"')
             else:
-                search_conditions = []
-                if len(title) > 0:
-                    search_conditions.append(Book.title.like(f"%{title}%"))
-                if len(author) > 0:
-                    search_conditions.append(Book.author.like(f"%{author}%"))
-                if len(publisher) > 0:
-                    search_conditions.append(Book.publisher.like(f"%{publisher}%"))
-                if len(subject) > 0:
-                    search_conditions.append(Book.subject.like(f"%{subject}%"))
-                if len(number) > 0:
-                    search_conditions.append(Book.number.like(f"%{number}%"))
-                if len(remarks) > 0:
-                    search_conditions.append(Book.remarks.like(f"%{remarks}%"))
-                if len(place) > 0:
-                    search_conditions.append(Book.place.like(f"%{place}%"))
-                if len(search_conditions) > 0:
-                    search_result = session.query(Book).filter(*search_conditions).all()
-                else:
-                    search_result = []
-        except sqlalchemy.exc.NoResultFound:
-            session.close()
-            return []
-        session.close()
-        result = []
-        for book in search_result:
-            result.append({"isbn_10": book.isbn_10, "isbn_13": book.isbn_13, "title": book.title, "author": book.author, "publisher": book.publisher, "subject": book.subject, "place": book.place, "number": book.number, "remarks": book.remarks})
-        return result
-        
+                search_conditions.append(getattr(Book, column).like(f"%{term}%"))
+        if len(fts_queries) > 0:
+            search_conditions.append(sqlalchemy.text("books.rowid IN (SELECT rowid FROM books_fts WHERE books_fts MATCH :fts_query)").bindparams(fts_query=' AND '.join(fts_queries)))
+        return search_conditions
+
     # 本の情報を更新する
+    @timed('update_book')
     def update_book(self, isbn_10:str, isbn_13:str, title:str, author:str, publisher:str, subject:str, number:str, remarks:str, place:str) -> bool:
         """本の情報を更新する
         
@@ -332,31 +1111,26 @@ class Database:
         Returns:
             bool: 本の情報が更新されたかどうか
         """
-        self.logger.info(f"Updating book: isbn_10={isbn_10}, isbn_13={isbn_13}, title={title}, author={author}, publisher={publisher}, subject={subject}, place={place}")
-        session = self.session_local()
+        self.logger.debug("Updating book: isbn_10=%s, isbn_13=%s, title=%s, author=%s, publisher=%s, subject=%s, place=%s", isbn_10, isbn_13, title, author, publisher, subject, place)
         try:
-            book = session.query(Book).filter(Book.isbn_10 == isbn_10).first()
-            if book is None:
-                self.logger.error(f"Failed to update book: Book not found")
-                session.close()
-                return False
-            book.title = title
-            book.author = author
-            book.publisher = publisher
-            book.subject = subject
-            book.number = number
-            book.remarks = remarks
-            book.place = place
-            book.updated_at = datetime.now()
-            session.commit()
-            session.refresh(book)
+            with self.write_scope() as session:
+                book = session.get(Book, isbn_10)
+                if book is None:
+                    self.logger.error("Failed to update book: Book not found")
+                    return False
+                book.title = title
+                book.author = author
+                book.publisher = publisher
+                book.subject = subject
+                book.number = number
+                book.remarks = remarks
+                book.place = place
+                book.updated_at = datetime.now()
+                self.commit_session(session)
         except:
-            self.logger.error(f"Failed to update book: {isbn_10}")
-            session.rollback()
-            session.close()
+            self.logger.exception("Failed to update book: %s", isbn_10)
             return False
-        session.close()
-        self.logger.info(f"Book updated: {isbn_10}")
+        self.logger.debug("Book updated: %s", isbn_10)
         return True
 
     # 本を削除する
@@ -369,24 +1143,20 @@ class Database:
         Returns:
             bool: 本が削除されたかどうか
         """
-        self.logger.info(f"Deleting book: isbn={isbn}")
+        self.logger.debug("Deleting book: isbn=%s", isbn)
         isbn_10, isbn_13 = calc_both_isbn(isbn)
-        session = self.session_local()
         try:
-            book = session.query(Book).filter(Book.isbn_10 == isbn_10).first()
-            if book is None:
-                self.logger.error(f"Failed to delete book: Book not found")
-                session.close()
-                return False
-            session.delete(book)
-            session.commit()
+            with self.write_scope() as session:
+                book = session.get(Book, isbn_10)
+                if book is None:
+                    self.logger.error("Failed to delete book: Book not found")
+                    return False
+                session.delete(book)
+                self.commit_session(session)
         except:
-            self.logger.error(f"Failed to delete book: {isbn}")
-            session.rollback()
-            session.close()
+            self.logger.exception("Failed to delete book: %s", isbn)
             return False
-        session.close()
-        self.logger.info(f"Book deleted: {isbn}")
+        self.logger.debug("Book deleted: %s", isbn)
         return True
 
     # 本が存在するか確認する
@@ -399,14 +1169,11 @@ class Database:
         Returns:
             bool: 本が存在するかどうか
         """
-        self.logger.info(f"Checking book exist: isbn={isbn}")
+        self.logger.debug("Checking book exist: isbn=%s", isbn)
         isbn_10, isbn_13 = calc_both_isbn(isbn)
-        session = self.session_local()
-        book = session.query(Book).filter(Book.isbn_10 == isbn_10).first()
-        session.close()
-        if book:
-            return True
-        return False
+        with self.session_scope() as session:
+            # 作業単位の中で取得済みの場合はデータベースに問い合わせずに済む
+            return session.get(Book, isbn_10) is not None
 
     # 本の情報のダウンロード用のデータを作成する
     def create_download_data(self) -> list[dict]:
@@ -418,19 +1185,70 @@ class Database:
         Returns:
             dict: 本の情報
         """
-        self.logger.info(f"Creating download data")
-        session = self.session_local()
-        books = session.query(Book).all()
-        session.close()
-        if books:
-            result = []
-            for book in books:
-                result.append({"isbn": book.isbn_10, "タイトル": book.title, "著者": book.author, "出版社": book.publisher, "件名標目": book.subject, "保管場所": book.place, "所持数": book.number, "備考": book.remarks})
+        self.logger.info("Creating download data")
+        headers = tuple(DOWNLOAD_COLUMNS)
+        result = [dict(zip(headers, row)) for row in self.iter_download_data()]
+        if result:
             return result
         else:
-            self.logger.error(f"Failed to create download data")
+            self.logger.error("Failed to create download data")
             return None
+
+    # ダウンロード用の本の情報を少しずつ取得する
+    def iter_download_data(self, batch_size: int=1000):
+        """ダウンロード用の本の情報を全件読み込まずに少しずつ取得する
+
+        Args:
+            batch_size (int): 1回にデータベースから読み込む件数
+
+        Yields:
+            tuple: DOWNLOAD_COLUMNSの順に並んだ本の情報
+        """
+        self.logger.info("Iterating download data: batch_size=%s", batch_size)
+        statement = select(*[getattr(Book, column) for column in DOWNLOAD_COLUMNS.values()])
+        with self.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True).execute(statement)
+            for rows in result.partitions(batch_size):
+                yield from rows
+
+    # 登録されている本の数を取得する
+    def count_books(self, isbn: str='', title: str='', author: str='', publisher: str='', subject: str='', number: str='', remarks: str='', place: str='') -> int:
+        """登録されている本の数を取得する
+
+        search_bookと同じ検索条件を指定した場合は、条件に一致する本の数を取得する。
+
+        Returns:
+            int: 本の数
+        """
+        statement = self.build_search_statement((func.count(Book.isbn_10),), isbn=isbn, title=title, author=author, publisher=publisher, subject=subject, number=number, remarks=remarks, place=place)
+        with self.session_scope() as session:
+            return session.execute(statement).scalar()
     
+class RateLimiter:
+    def __init__(self, rate: float):
+        """1秒あたりのリクエスト数を制限する
+
+        Args:
+            rate (float): 1秒あたりの最大リクエスト数(0以下の場合は制限なし)
+        """
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def acquire(self) -> None:
+        """次のリクエストを送れるまで待機する"""
+        if self.interval == 0.0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_time - now
+            self.next_time = max(self.next_time, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
 def is_composed_of(s: str, allowed_chars: str) -> bool:
     return all(char in allowed_chars for char in s)
 
+def is_book_info_complete(book_info: dict) -> bool:
+    return all(len(book_info.get(key, '')) > 0 for key in ('title', 'author', 'publisher', 'subject'))
+